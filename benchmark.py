@@ -0,0 +1,54 @@
+"""Rough timings for the heavier converters on synthetic documents.
+
+    python benchmark.py pdf_to_word [pages] [workers]
+    python benchmark.py text_to_pdf [lines]
+"""
+import os
+import sys
+import time
+import tempfile
+import fitz
+import pdf_utils
+
+def make_sample_pdf(path, pages=200):
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        y = 72
+        page.insert_text((72, y), f"Section {i + 1}", fontsize=16)
+        for line in range(30):
+            y += 20
+            page.insert_text((72, y), f"Line {line + 1} of page {i + 1}: the quick brown fox jumps over the lazy dog.", fontsize=10)
+    doc.save(path)
+    doc.close()
+
+def bench_pdf_to_word(pages=200, workers=None):
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, "sample.pdf")
+        make_sample_pdf(src, pages)
+        results = {}
+        for n in sorted({1, workers or os.cpu_count() or 1}):
+            start = time.perf_counter()
+            pdf_utils.pdf_to_word(src, os.path.join(tmp, f"out_{n}.docx"), workers=n)
+            results[n] = time.perf_counter() - start
+            print(f"pdf_to_word {pages} pages, {n} worker(s): {results[n]:.1f}s")
+        if len(results) > 1:
+            print(f"speedup: {results[1] / results[max(results)]:.1f}x")
+
+def bench_text_to_pdf(lines=1_000_000):
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, "sample.log")
+        with open(src, "w") as f:
+            for i in range(lines):
+                f.write(f"2024-01-01 00:00:{i % 60:02d} INFO worker-{i % 8} request {i} served in {i % 997}ms"
+                        + " payload" * (i % 20) + "\n")
+        start = time.perf_counter()
+        pages = pdf_utils.text_file_to_pdf(src, os.path.join(tmp, "sample.pdf"))
+        seconds = time.perf_counter() - start
+        print(f"text_to_pdf {lines} lines -> {pages} pages: {seconds:.1f}s ({lines / seconds * 60 / 1e6:.2f}M lines/min)")
+
+BENCHMARKS = {"pdf_to_word": bench_pdf_to_word, "text_to_pdf": bench_text_to_pdf}
+
+if __name__ == "__main__":
+    name = sys.argv[1] if len(sys.argv) > 1 else "pdf_to_word"
+    BENCHMARKS[name](*map(int, sys.argv[2:]))
@@ -1,3 +1,5 @@
+import os
+
 def parse_time(time_str):
     # Parses "MM:SS" or "HH:MM:SS" or "SS" to seconds
     parts = list(map(int, time_str.split(':')))
@@ -8,3 +10,17 @@ def parse_time(time_str):
     elif len(parts) == 3:
         return parts[0] * 3600 + parts[1] * 60 + parts[2]
     return 0
+
+def mirror_folder(input_dir, output_dir, extensions, recursive=False, new_ext=None):
+    # Yields (input_path, output_path, relative_path) for every file under input_dir ending in one of
+    # extensions, in sorted order. Output paths repeat the folder layout under output_dir (with the
+    # extension swapped for new_ext if given); relative paths use "/" on every platform.
+    for root, dirs, files in os.walk(input_dir):
+        if not recursive: dirs.clear()
+        dirs.sort()
+        for name in sorted(files):
+            if not name.lower().endswith(extensions): continue
+            path = os.path.join(root, name)
+            rel = os.path.relpath(path, input_dir).replace(os.sep, "/")
+            out_rel = os.path.splitext(rel)[0] + new_ext if new_ext else rel
+            yield path, os.path.join(output_dir, *out_rel.split("/")), rel
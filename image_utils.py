@@ -1,9 +1,12 @@
 import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from PIL import Image, ImageOps, ImageFilter, ImageDraw
 import cv2
 import numpy as np
 try:
-    from rembg import remove as remove_bg
+    from rembg import remove as remove_bg, new_session
 except ImportError:
     remove_bg = None
 import pytesseract
@@ -11,6 +14,8 @@ from psd_tools import PSDImage
 from svglib.svglib import svg2rlg
 from reportlab.graphics import renderPM
 import moviepy.editor as mp # For gif to mp4 in convert_image
+import pdf_utils
+from common_utils import mirror_folder
 
 # Supported HEIC/AVIF
 try:
@@ -36,6 +41,8 @@ def get_thumbnail(path, max_size=(300, 300)):
             if ret:
                 frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
                 img = Image.fromarray(frame)
+        elif ext == '.pdf':
+            img = pdf_utils.pdf_thumbnail(path, max_size)
         
         if img:
             img.thumbnail(max_size)
@@ -44,14 +51,85 @@ def get_thumbnail(path, max_size=(300, 300)):
         pass
     return None
 
+_IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp', '.tiff')
+
+class BackgroundRemover:
+    """Background removal with one model session, loaded on first use and reused for every image.
+    threads sets the ONNX intra-op thread count (default: onnxruntime's own); images whose long side is
+    above max_side are shrunk for mask inference and the mask is scaled back up, which costs nothing in
+    quality as the models work at 320-1024 px anyway."""
+    def __init__(self, model="u2net", threads=None, max_side=1024):
+        self.model = model
+        self.threads = threads
+        self.max_side = max_side
+        self._session = None
+        self.stats = {"images": 0, "seconds": 0.0, "images_per_second": 0.0}
+
+    @property
+    def session(self):
+        if self._session is None:
+            if not remove_bg:
+                raise ImportError("rembg not installed properly")
+            # rembg builds its onnxruntime SessionOptions from OMP_NUM_THREADS
+            previous = os.environ.get("OMP_NUM_THREADS")
+            if self.threads: os.environ["OMP_NUM_THREADS"] = str(self.threads)
+            try:
+                self._session = new_session(self.model)
+            finally:
+                if previous is None: os.environ.pop("OMP_NUM_THREADS", None)
+                else: os.environ["OMP_NUM_THREADS"] = previous
+        return self._session
+
+    def remove(self, img):
+        """PIL image in, RGBA cut-out of the same size out."""
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        small = img
+        if max(img.size) > self.max_side:
+            small = img.copy()
+            small.thumbnail((self.max_side, self.max_side), Image.BILINEAR)
+        mask = remove_bg(small, session=self.session, only_mask=True).convert("L")
+        if mask.size != img.size: mask = mask.resize(img.size, Image.BILINEAR)
+        img.putalpha(mask)
+        return img
+
+    def remove_file(self, input_path, output_path):
+        with Image.open(input_path) as img:
+            cutout = self.remove(img)
+        cutout.save(output_path, "PNG")
+
+    def remove_folder(self, input_dir, output_dir, workers=2, recursive=False, progress=None):
+        """Cut out every image under input_dir into PNGs in output_dir. A few threads share the session so
+        decoding and saving overlap inference. progress(done, total) is called per image; self.stats
+        holds the throughput. Returns (done, failed): {input_path: output_path} and {input_path: error}."""
+        jobs = [(path, out_path) for path, out_path, _ in
+                mirror_folder(input_dir, output_dir, _IMAGE_EXTS, recursive, new_ext=".png")]
+        self.session  # load the model before the clock starts
+        def run(job):
+            try:
+                os.makedirs(os.path.dirname(job[1]), exist_ok=True)
+                self.remove_file(*job)
+                return job, None
+            except Exception as e:
+                return job, str(e)
+        done, failed = {}, {}
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for (input_path, output_path), error in pool.map(run, jobs):
+                if error: failed[input_path] = error
+                else: done[input_path] = output_path
+                if progress: progress(len(done) + len(failed), len(jobs))
+        seconds = time.perf_counter() - start
+        self.stats["images"] += len(done)
+        self.stats["seconds"] += seconds
+        self.stats["images_per_second"] = self.stats["images"] / self.stats["seconds"] if self.stats["seconds"] else 0.0
+        return done, failed
+
+_background_remover = None
+
 def remove_background(input_path, output_path):
-    if not remove_bg:
-        raise ImportError("rembg not installed properly")
-    with open(input_path, 'rb') as i:
-        input_data = i.read()
-        output_data = remove_bg(input_data)
-    with open(output_path, 'wb') as o:
-        o.write(output_data)
+    global _background_remover
+    if _background_remover is None: _background_remover = BackgroundRemover()
+    _background_remover.remove_file(input_path, output_path)
 
 def upscale_image(input_path, output_path, scale=2):
     img = Image.open(input_path)
@@ -200,18 +278,122 @@ def adjust_brightness_contrast(input_path, output_path, brightness=1.0, contrast
     
     img.save(output_path)
 
-def blur_faces(input_path, output_path, blur_strength=30):
-    """Detect and blur faces in an image for privacy."""
-    img = cv2.imread(input_path)
+_face_cascade = None
+
+def _face_detector():
+    # one per process, so pool workers read the cascade XML once
+    global _face_cascade
+    if _face_cascade is None:
+        _face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    return _face_cascade
+
+def detect_faces(img, max_side=1280):
+    """Face boxes (x, y, w, h) in a BGR image. Detection runs on a copy shrunk to max_side, which finds
+    the same faces in a fraction of the time on large photos, and the boxes are scaled back."""
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    
-    # Load face cascade
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-    faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
-    
+    scale = min(1.0, max_side / max(gray.shape))
+    if scale < 1.0:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    min_size = max(12, int(30 * scale))
+    faces = _face_detector().detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(min_size, min_size))
+    height, width = img.shape[:2]
+    boxes = []
+    for face in faces:
+        # rounding on the way back up can push a box past the last row or column
+        x, y, w, h = (int(round(v / scale)) for v in face)
+        x, y = min(max(x, 0), width - 1), min(max(y, 0), height - 1)
+        boxes.append((x, y, min(w, width - x), min(h, height - y)))
+    return boxes
+
+def anonymize_faces(img, mode="blur", strength=30, max_side=1280):
+    """Blur or pixelate every face in a BGR image in place. strength (1-100) follows the face size: the
+    blur kernel is strength% of the face width and pixel blocks are a third of that."""
+    if mode not in ("blur", "pixelate"):
+        raise ValueError(f"Unknown mode: {mode}")
+    faces = detect_faces(img, max_side)
     for (x, y, w, h) in faces:
-        face_region = img[y:y+h, x:x+w]
-        blurred_face = cv2.GaussianBlur(face_region, (blur_strength, blur_strength), 0)
-        img[y:y+h, x:x+w] = blurred_face
-    
+        face = img[y:y+h, x:x+w]
+        if mode == "blur":
+            k = max(3, int(w * strength / 100)) | 1
+            img[y:y+h, x:x+w] = cv2.GaussianBlur(face, (k, k), 0)
+        else:
+            cell = max(1, int(w * strength / 300))
+            small = cv2.resize(face, (max(1, w // cell), max(1, h // cell)), interpolation=cv2.INTER_AREA)
+            img[y:y+h, x:x+w] = cv2.resize(small, (w, h), interpolation=cv2.INTER_NEAREST)
+    return len(faces)
+
+def blur_faces(input_path, output_path, blur_strength=30, mode="blur"):
+    """Detect and blur faces in an image for privacy."""
+    img = cv2.imread(input_path)
+    if img is None:
+        raise ValueError(f"Cannot read image: {input_path}")
+    anonymize_faces(img, mode, blur_strength)
     cv2.imwrite(output_path, img)
+
+def _blur_faces_file(job):
+    input_path, output_path, mode, strength = job
+    try:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        blur_faces(input_path, output_path, strength, mode)
+        return input_path, output_path, None
+    except Exception as e:
+        return input_path, None, str(e)
+
+def blur_faces_folder(input_dir, output_dir, mode="blur", strength=30, workers=None, recursive=False):
+    """blur_faces for every image under input_dir in a process pool, mirroring the folder layout in
+    output_dir. Returns (done, failed): {input_path: output_path} and {input_path: error message}."""
+    jobs = [(path, out_path, mode, strength)
+            for path, out_path, _ in mirror_folder(input_dir, output_dir, _IMAGE_EXTS, recursive)]
+    done, failed = {}, {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for input_path, output_path, error in pool.map(_blur_faces_file, jobs, chunksize=4):
+            if error: failed[input_path] = error
+            else: done[input_path] = output_path
+    return done, failed
+
+def _blur_frames(frames, mode, strength, max_side):
+    for frame in frames:
+        anonymize_faces(frame, mode, strength, max_side)
+    return frames
+
+def blur_faces_video(input_path, output_path, mode="blur", strength=30, workers=None, batch_size=16, max_side=960):
+    """Anonymize faces in every frame of a video, with batches of frames spread over a process pool and
+    written back in order. The video is re-encoded as MPEG-4 without its audio track. Returns stats."""
+    cap = cv2.VideoCapture(input_path)
+    if not cap.isOpened():
+        raise ValueError(f"Cannot open video: {input_path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25
+    size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+    workers = workers or os.cpu_count() or 1
+    frames, start = 0, time.perf_counter()
+
+    def batches():
+        while True:
+            batch = []
+            while len(batch) < batch_size:
+                ok, frame = cap.read()
+                if not ok: break
+                batch.append(frame)
+            if not batch: return
+            yield batch
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # a bounded window of batches in flight keeps memory flat on long videos
+            pending = deque()
+            for batch in batches():
+                pending.append(pool.submit(_blur_frames, batch, mode, strength, max_side))
+                while len(pending) >= workers * 2 or (pending and pending[0].done()):
+                    for frame in pending.popleft().result():
+                        writer.write(frame)
+                        frames += 1
+            while pending:
+                for frame in pending.popleft().result():
+                    writer.write(frame)
+                    frames += 1
+    finally:
+        cap.release()
+        writer.release()
+    seconds = time.perf_counter() - start
+    return {"frames": frames, "seconds": seconds, "fps": frames / seconds if seconds else 0.0}
@@ -1,411 +1,2137 @@
 import os
+import re
+import csv
+import html
+import base64
+import mimetypes
+import shutil
+import sqlite3
+import tempfile
+import zipfile
+import mmap
+import xml.etree.ElementTree as ET
+from urllib.parse import unquote, urljoin, urlparse
+import math
+import hashlib
+import zlib
+import time
+import json
+import threading
+import secrets
+from datetime import date
 import requests
-from io import BytesIO
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from io import BytesIO, TextIOBase, TextIOWrapper
+from contextlib import contextmanager, ExitStack
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice, accumulate, count
+from bisect import bisect_right
+from common_utils import mirror_folder
 import fitz
 from pypdf import PdfWriter, PdfReader
 from pdf2docx import Converter
-from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
+from reportlab.pdfbase import pdfmetrics
 import pdfplumber
-import pandas as pd
+from openpyxl import Workbook
 from pptx import Presentation
 try:
     import extract_msg
 except ImportError:
     extract_msg = None
+try:
+    import pytesseract
+except ImportError:
+    pytesseract = None
 from xhtml2pdf import pisa
 from deep_translator import GoogleTranslator
-import ebooklib
-from ebooklib import epub
 from bs4 import BeautifulSoup
-from PIL import Image
-
-def add_password(input_path, output_path, password):
-    reader = PdfReader(input_path)
-    writer = PdfWriter()
-    for page in reader.pages:
-        writer.add_page(page)
-    writer.encrypt(password)
-    with open(output_path, "wb") as f:
-        writer.write(f)
+from PIL import Image, ImageChops, TiffImagePlugin
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+except ImportError: pass
+
+PDF_PERMISSIONS = {"print": fitz.PDF_PERM_PRINT, "print_hq": fitz.PDF_PERM_PRINT_HQ, "modify": fitz.PDF_PERM_MODIFY,
+                   "copy": fitz.PDF_PERM_COPY, "annotate": fitz.PDF_PERM_ANNOTATE, "form": fitz.PDF_PERM_FORM,
+                   "accessibility": fitz.PDF_PERM_ACCESSIBILITY, "assemble": fitz.PDF_PERM_ASSEMBLE}
+
+def add_password(input_path, output_path, password, owner_password=None, permissions=None):
+    """AES-256 encrypt the whole document (outlines, forms and metadata included) in one save.
+    permissions is an iterable of PDF_PERMISSIONS names granted to the user password; None grants all.
+    When permissions are restricted and no owner password is given a random one is used, otherwise
+    the user password would also unlock the restrictions."""
+    if permissions is None:
+        flags = -1
+    else:
+        flags = 0
+        for name in permissions: flags |= PDF_PERMISSIONS[name]
+        owner_password = owner_password or secrets.token_urlsafe(24)
+    with _pdf_input(input_path) as src, _open_fitz(src) as doc:
+        if doc.needs_pass: raise ValueError("PDF is already encrypted.")
+        doc.save(output_path, encryption=fitz.PDF_ENCRYPT_AES_256, user_pw=password,
+                 owner_pw=owner_password or password, permissions=flags, garbage=1, deflate=True)
 
 def unlock_pdf(input_path, output_path, password=""):
-    reader = PdfReader(input_path)
-    if reader.is_encrypted:
-        success = reader.decrypt(password)
-        if not success:
+    with _pdf_input(input_path) as src, _open_fitz(src) as doc:
+        if doc.needs_pass and not doc.authenticate(password):
             raise ValueError("Incorrect password or encryption not supported.")
-    writer = PdfWriter()
-    for page in reader.pages:
-        writer.add_page(page)
-    with open(output_path, "wb") as f:
-        writer.write(f)
-
-def rotate_pdf(input_path, output_path, degrees=90):
-    reader = PdfReader(input_path)
-    writer = PdfWriter()
-    for page in reader.pages:
-        page.rotate(int(degrees))
-        writer.add_page(page)
-    with open(output_path, "wb") as f:
-        writer.write(f)
-
-def delete_pages(input_path, output_path, pages_to_delete):
-    reader = PdfReader(input_path)
-    writer = PdfWriter()
-    for i, page in enumerate(reader.pages):
-        if (i + 1) not in pages_to_delete:
-            writer.add_page(page)
-    with open(output_path, "wb") as f:
-        writer.write(f)
+        doc.save(output_path, encryption=fitz.PDF_ENCRYPT_NONE, garbage=1, deflate=True)
+
+def read_password_manifest(csv_path):
+    """Read file,password[,owner_password] rows (a header row is optional) into
+    {file: (password, owner_password)}; file is relative to the folder being processed."""
+    manifest = {}
+    with open(csv_path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or not row[0].strip() or row[0].strip().lower() in ("file", "filename", "path"): continue
+            key = row[0].strip().replace("\\", "/")
+            manifest[key] = (row[1], row[2] if len(row) > 2 and row[2] else None)
+    return manifest
+
+def _secure_file(mode, input_path, output_path, password, owner_password, permissions):
+    """Pool worker: returns (input_path, output_path, error)."""
+    try:
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        if mode == "encrypt": add_password(input_path, output_path, password, owner_password, permissions)
+        else: unlock_pdf(input_path, output_path, password)
+        return input_path, output_path, None
+    except Exception as e:
+        return input_path, None, str(e)
+
+def secure_folder(input_dir, output_dir, mode="encrypt", password=None, manifest=None, owner_password=None,
+                  permissions=None, recursive=False, workers=None):
+    """Encrypt or decrypt every PDF under input_dir in the process pool, mirroring the folder layout in
+    output_dir. Passwords come from manifest (a CSV path or a read_password_manifest dict, matched by
+    relative path, then file name) and fall back to password. Returns (done, failed):
+    {input_path: output_path} and {input_path: error message}."""
+    if mode not in ("encrypt", "decrypt"): raise ValueError(f"Unknown mode: {mode}")
+    if isinstance(manifest, str): manifest = read_password_manifest(manifest)
+    manifest = manifest or {}
+    jobs, failed = [], {}
+    for path, out_path, rel in mirror_folder(input_dir, output_dir, ".pdf", recursive):
+        name = rel.rsplit("/", 1)[-1]
+        file_password, file_owner = manifest.get(rel) or manifest.get(name) or (password, owner_password)
+        if file_password is None and mode == "encrypt":
+            failed[path] = "No password given"
+            continue
+        jobs.append((mode, path, out_path, file_password or "", file_owner, permissions))
+    done = {}
+    for path, out_path, error in _pool_map(_secure_file, jobs, workers, ordered=False):
+        if error: failed[path] = error
+        else: done[path] = out_path
+    return done, failed
+
+class PageOps:
+    """Queue page operations and apply them all with one read and one write:
+
+        PageOps("in.pdf").rotate(90, "1-5").delete("9").crop((10, 10, 10, 10)).reorder("3-1,4-").save("out.pdf")
+
+    Page selectors refer to the document as it looks after the operations queued before them.
+    incremental=True (fitz backend) appends only the changed page objects instead of rewriting the file.
+    """
+    def __init__(self, input_path, backend="fitz"):
+        if backend not in ("fitz", "pypdf"):
+            raise ValueError(f"Unknown backend: {backend}")
+        self.input_path = input_path
+        self.backend = backend
+        self.ops = []
+
+    def rotate(self, degrees, pages=None):
+        self.ops.append(("rotate", int(degrees), pages))
+        return self
+
+    def delete(self, pages):
+        self.ops.append(("delete", None, [] if pages is None else pages))
+        return self
+
+    def crop(self, margins, pages=None):
+        """margins are (left, top, right, bottom) in points."""
+        self.ops.append(("crop", tuple(float(m) for m in margins), pages))
+        return self
+
+    def reorder(self, order):
+        """Keep only the selected pages, in the given order (duplicates allowed)."""
+        self.ops.append(("reorder", None, order))
+        return self
+
+    def _plan(self, page_count):
+        """Resolve the queue into [original index, rotation, margins] for each output page."""
+        plan = [[i, 0, None] for i in range(page_count)]
+        for op, arg, pages in self.ops:
+            picked = parse_page_range(pages, len(plan))
+            if op == "delete":
+                drop = set(picked)
+                plan = [entry for k, entry in enumerate(plan) if k not in drop]
+            elif op == "reorder":
+                plan = [list(plan[k]) for k in picked]
+            else:
+                for k in set(picked):
+                    if op == "rotate": plan[k][1] += arg
+                    elif plan[k][2]: plan[k][2] = tuple(a + b for a, b in zip(plan[k][2], arg))
+                    else: plan[k][2] = arg
+        if not plan: raise ValueError("No pages left to save")
+        return plan
+
+    def save(self, output_path, incremental=False):
+        """incremental=True (implied when saving onto the input) appends the edits to the file rather than
+        rewriting it, falling back to a full rewrite for in-memory files or the pypdf backend."""
+        with _pdf_input(self.input_path) as src:
+            if self.backend == "pypdf" and not _same_file(src, output_path):
+                return self._save_pypdf(src, output_path)
+            return self._save_fitz(src, output_path, incremental)
+
+    def _save_pypdf(self, src, output_path):
+        # the writer reads page content from the cached reader's stream, so it is held until written
+        with DOCUMENT_CACHE.pypdf(src) as reader:
+            writer = PdfWriter()
+            for orig, rot, margins in self._plan(len(reader.pages)):
+                # edit the writer's copy of the page, the cached reader is shared
+                page = writer.add_page(reader.pages[orig])
+                if rot: page.rotate(rot)
+                if margins:
+                    left, top, right, bottom = margins
+                    x0, y0 = page.cropbox.lower_left
+                    x1, y1 = page.cropbox.upper_right
+                    if x1 - right > x0 + left and y1 - top > y0 + bottom:
+                        page.cropbox.lower_left = (x0 + left, y0 + bottom)
+                        page.cropbox.upper_right = (x1 - right, y1 - top)
+            writer.write(output_path)
+
+    def _save_fitz(self, src, output_path, incremental):
+        with _edited_pdf(src, output_path, incremental, garbage=3, deflate=True) as doc:
+            plan = self._plan(len(doc))
+            order = [entry[0] for entry in plan]
+            if order != list(range(len(doc))): doc.select(order)
+            # duplicated pages share one page object: a copy edited like the first stays shared and is
+            # edited once, a copy edited differently becomes a page of its own before anything is changed
+            first, shared = {}, set()
+            for pos, (orig, rot, margins) in enumerate(plan):
+                if orig not in first:
+                    first[orig] = pos
+                elif plan[first[orig]][1:] == [rot, margins]:
+                    shared.add(pos)
+                else:
+                    doc.fullcopy_page(pos, pos)
+                    doc.delete_page(pos + 1)
+            for pos, (orig, rot, margins) in enumerate(plan):
+                if pos in shared: continue
+                page = doc[pos]
+                if rot % 360: page.set_rotation((page.rotation + rot) % 360)
+                if margins:
+                    left, top, right, bottom = margins
+                    cb = page.cropbox
+                    box = fitz.Rect(cb.x0 + left, cb.y0 + top, cb.x1 - right, cb.y1 - bottom)
+                    if box.x1 > box.x0 and box.y1 > box.y0: page.set_cropbox(box)
+
+def rotate_pdf(input_path, output_path, degrees=90, pages=None, incremental=False):
+    PageOps(input_path).rotate(degrees, pages).save(output_path, incremental)
+
+def delete_pages(input_path, output_path, pages_to_delete, incremental=False):
+    PageOps(input_path).delete(pages_to_delete).save(output_path, incremental)
+
+_STAMP_FIELD = re.compile(r"\{\{|\}\}|\{(page|total|filename|date)([^{}]*)\}")
+
+class TextStamp:
+    """Text drawn on every selected page. The text may use {page}, {total}, {filename} and {date};
+    other braces are left as they are, {{ and }} give literal braces.
+    position is a named spot ("center", "bottom-right", "top-left", ...) or (x, y) in points from
+    the bottom-left corner; rotate turns the text counter-clockwise around its anchor."""
+    def __init__(self, text, position="center", fontsize=12, color=(0, 0, 0), opacity=1.0, rotate=0,
+                 fontname="helv", pages=None):
+        self.text = text
+        self.position = position
+        self.fontsize = fontsize
+        self.color = color
+        self.opacity = opacity
+        self.rotate = rotate
+        self.fontname = fontname
+        self.pages = pages
+
+    @property
+    def per_page(self):
+        return any(m.group(1) == "page" for m in _STAMP_FIELD.finditer(self.text))
+
+    def format(self, **fields):
+        def field(m):
+            if not m.group(1): return m.group(0)[0]
+            try: return ("{" + m.group(1) + m.group(2) + "}").format(**fields)
+            except (KeyError, IndexError, AttributeError, ValueError): return m.group(0)
+        return _STAMP_FIELD.sub(field, self.text)
+
+    def draw(self, page, text):
+        w, h = page.rect.width, page.rect.height
+        tw = fitz.get_text_length(text, fontname=self.fontname, fontsize=self.fontsize)
+        if isinstance(self.position, str):
+            pos = self.position.lower()
+            x = 36 if "left" in pos else w - 36 - tw if "right" in pos else (w - tw) / 2
+            y = 36 + self.fontsize if "top" in pos else h - 20 if "bottom" in pos else (h + self.fontsize * 0.7) / 2
+        else:
+            x, y = float(self.position[0]), h - float(self.position[1])
+        # positions are worked out on the page as displayed, then mapped back for rotated pages
+        derotate = page.derotation_matrix
+        morph = None
+        if self.rotate:
+            pivot = fitz.Point(x + tw / 2, y - self.fontsize * 0.35) if isinstance(self.position, str) else fitz.Point(x, y)
+            morph = (pivot * derotate, fitz.Matrix(self.rotate))
+        page.insert_text(fitz.Point(x, y) * derotate, text, fontsize=self.fontsize, fontname=self.fontname,
+                         color=self.color, fill_opacity=self.opacity, stroke_opacity=self.opacity,
+                         rotate=page.rotation, morph=morph)
+
+class ImageStamp:
+    """Image placed at rect = (x, y, width, height), measured from the top-left corner; path may also
+    be the image bytes or a binary file object. The image is read once and stored once; every page
+    references the same xref."""
+    def __init__(self, path, rect, pages=None, keep_proportion=True):
+        self.path = path
+        self.rect = rect
+        self.pages = pages
+        self.keep_proportion = keep_proportion
+
+    @property
+    def key(self):
+        return self.path if _is_path(self.path) else id(self.path)
+
+    def read(self):
+        if _is_path(self.path):
+            with open(self.path, "rb") as f: return f.read()
+        return bytes(self.path) if isinstance(self.path, (bytes, bytearray, memoryview)) else self.path.read()
+
+def stamp_pdf(input_path, output_path, stamps, incremental=False):
+    """Apply text and image stamps in a single pass. Text that is the same on every page is drawn
+    once per distinct page size and rotation into a shared form XObject. incremental works as for
+    PageOps.save."""
+    # stamps already share their xrefs, so skip the costly duplicate search of garbage=3
+    with _pdf_input(input_path) as src, _edited_pdf(src, output_path, incremental, garbage=1, deflate=True) as doc:
+        total = len(doc)
+        name = os.path.basename(input_path) if _is_path(input_path) else ""
+        fields = {"total": total, "filename": name, "date": date.today().isoformat()}
+        selected = [set(parse_page_range(stamp.pages, total)) for stamp in stamps]
+        images = {}
+        for stamp in stamps:
+            if isinstance(stamp, ImageStamp) and stamp.key not in images:
+                images[stamp.key] = [stamp.read(), 0]
+        active = [[k for k in range(len(stamps)) if i in selected[k]] for i in range(total)]
+        # first pass: one template page per distinct (displayed page size, static stamps) combination,
+        # drawn upright and turned with the page when it is placed. show_pdf_page misplaces it on rotated
+        # pages with an offset crop box, so those get their stamps drawn directly.
+        keys, shared = [None] * total, {}
+        stamp_doc = fitz.open()
+        for i, page in enumerate(doc):
+            static = tuple(k for k in active[i] if isinstance(stamps[k], TextStamp) and not stamps[k].per_page)
+            if not static: continue
+            if page.rotation and not (page.cropbox == page.mediabox and page.mediabox.x0 == page.mediabox.y0 == 0):
+                continue
+            keys[i] = (round(page.rect.width, 2), round(page.rect.height, 2), static)
+            if keys[i] not in shared:
+                tpl = stamp_doc.new_page(width=page.rect.width, height=page.rect.height)
+                for k in static:
+                    stamps[k].draw(tpl, stamps[k].format(**fields))
+                shared[keys[i]] = tpl.number
+        if shared:
+            stamp_doc = fitz.open("pdf", stamp_doc.tobytes())
+        for i, page in enumerate(doc):
+            if keys[i]:
+                page.show_pdf_page(page.rect * page.derotation_matrix, stamp_doc, shared[keys[i]], rotate=page.rotation)
+            for k in active[i]:
+                stamp = stamps[k]
+                if isinstance(stamp, ImageStamp):
+                    x, y, w, h = (float(v) for v in stamp.rect)
+                    data = images[stamp.key]
+                    if data[1]:
+                        page.insert_image(fitz.Rect(x, y, x + w, y + h), xref=data[1], keep_proportion=stamp.keep_proportion)
+                    else:
+                        data[1] = page.insert_image(fitz.Rect(x, y, x + w, y + h), stream=data[0], keep_proportion=stamp.keep_proportion)
+                elif not keys[i] or k not in keys[i][2]:
+                    stamp.draw(page, stamp.format(page=i + 1, **fields))
+        stamp_doc.close()
+
+def _literal(text):
+    return text.replace("{", "{{").replace("}", "}}")
 
 def add_watermark(input_path, output_path, watermark_text):
-    reader = PdfReader(input_path)
-    writer = PdfWriter()
-    packet = BytesIO()
-    can = canvas.Canvas(packet, pagesize=letter)
-    can.setFont("Helvetica", 60)
-    can.setFillColorRGB(0.6, 0.6, 0.6, 0.3)
-    can.saveState()
-    can.translate(300, 500)
-    can.rotate(45)
-    can.drawCentredString(0, 0, watermark_text)
-    can.restoreState()
-    can.save()
-    packet.seek(0)
-    watermark_pdf = PdfReader(packet)
-    watermark_page = watermark_pdf.pages[0]
-    for page in reader.pages:
-        page.merge_page(watermark_page)
-        writer.add_page(page)
-    with open(output_path, "wb") as f:
-        writer.write(f)
-
-def add_page_numbers(input_path, output_path):
-    reader = PdfReader(input_path)
-    writer = PdfWriter()
-    n_pages = len(reader.pages)
-    for i, page in enumerate(reader.pages):
-        packet = BytesIO()
-        w = float(page.mediabox.width)
-        h = float(page.mediabox.height)
-        can = canvas.Canvas(packet, pagesize=(w, h))
-        can.setFont("Helvetica", 10)
-        can.drawString(w - 50, 20, f"{i+1}/{n_pages}")
-        can.save()
-        packet.seek(0)
-        num_pdf = PdfReader(packet)
-        page.merge_page(num_pdf.pages[0])
-        writer.add_page(page)
-    with open(output_path, "wb") as f:
-        writer.write(f)
+    stamp = TextStamp(_literal(watermark_text), "center", fontsize=60, color=(0.6, 0.6, 0.6), opacity=0.3, rotate=45)
+    stamp_pdf(input_path, output_path, [stamp])
 
-def pdf_to_text(input_path, output_path):
-    doc = fitz.open(input_path)
-    with open(output_path, "w", encoding="utf-8") as f:
-        for page in doc:
-            f.write(page.get_text())
+def add_page_numbers(input_path, output_path, template="{page}/{total}", position="bottom-right"):
+    stamp_pdf(input_path, output_path, [TextStamp(template, position, fontsize=10)])
+
+def _extract_text(input_path, start, stop):
+    """(input_path, [(index, text), ...], error): a page that can't be read is left out and reported in
+    error without losing the rest of the batch."""
+    pages, error = [], None
+    try:
+        with _worker_doc(input_path) as doc:
+            if doc.needs_pass: raise ValueError("PDF is encrypted")
+            for i in range(start, stop):
+                try:
+                    pages.append((i, doc[i].get_text()))
+                except Exception as e:
+                    error = f"page {i + 1}: {e}"
+    except Exception as e:
+        error = str(e)
+    return input_path, pages, error
+
+def _text_jobs(paths, batch_size):
+    """Split every file into page batches; files that can't be opened or read become a single failing job."""
+    jobs = {}
+    for path in paths:
+        try:
+            with _open_fitz(path) as doc:
+                n = 0 if doc.needs_pass else len(doc)
+        except Exception:
+            n = 0
+        jobs[path] = [(path, a, min(a + batch_size, n)) for a in range(0, n, batch_size)] or [(path, 0, 0)]
+    return jobs
+
+def pdf_to_text(input_path, output_path, workers=None, batch_size=32):
+    with _pdf_input(input_path) as src, _text_output(output_path) as f:
+        for _, pages, error in _pool_map(_extract_text, _text_jobs([src], batch_size)[src], workers):
+            if error: raise ValueError(f"Cannot extract text from {_source_name(src)}: {error}")
+            for _, text in pages:
+                f.write(text)
+
+class PdfIndex:
+    """Full-text index of a PDF library in SQLite FTS5, one row per page.
+
+        index = PdfIndex("library.db")
+        index.update("/archive")            # only new or changed files are extracted
+        index.search("ABC-1234")            # [(path, page, snippet), ...]
+    """
+    def __init__(self, db_path):
+        self.conn = sqlite3.connect(db_path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, pages INTEGER);
+            CREATE VIRTUAL TABLE IF NOT EXISTS pages USING fts5(text, path UNINDEXED, page UNINDEXED);
+        """)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def update(self, sources, workers=None, batch_size=32, remove_missing=True):
+        """Index the given PDF files and/or folders (searched recursively), skipping files whose size and
+        mtime are unchanged. Returns counts of added, updated, removed, unchanged and failed files."""
+        if isinstance(sources, str): sources = [sources]
+        found = {}
+        for src in sources:
+            if os.path.isdir(src):
+                for root, _, files in os.walk(src):
+                    for name in files:
+                        if name.lower().endswith(".pdf"): found[os.path.abspath(os.path.join(root, name))] = None
+            elif os.path.isfile(src):
+                found[os.path.abspath(src)] = None
+        known = {row[0]: row[1:] for row in self.conn.execute("SELECT path, size, mtime FROM files")}
+        counts = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0, "failed": 0}
+        changed = []
+        for path in found:
+            st = os.stat(path)
+            found[path] = (st.st_size, st.st_mtime)
+            if known.get(path) == found[path]: counts["unchanged"] += 1
+            else:
+                changed.append(path)
+                counts["updated" if path in known else "added"] += 1
+        stale = [path for path in known if path not in found] if remove_missing else []
+        with self.conn:
+            for path in changed + stale:
+                self.conn.execute("DELETE FROM pages WHERE path = ?", (path,))
+            for path in stale:
+                self.conn.execute("DELETE FROM files WHERE path = ?", (path,))
+        counts["removed"] = len(stale)
+        jobs = _text_jobs(changed, batch_size)
+        remaining = {path: len(file_jobs) for path, file_jobs in jobs.items()}
+        page_counts = dict.fromkeys(jobs, 0)
+        failed = set()
+        all_jobs = [job for file_jobs in jobs.values() for job in file_jobs]
+        for path, pages, error in _pool_map(_extract_text, all_jobs, workers, ordered=False):
+            with self.conn:
+                if error: failed.add(path)
+                self.conn.executemany("INSERT INTO pages (text, path, page) VALUES (?, ?, ?)",
+                                      [(text, path, i + 1) for i, text in pages])
+                page_counts[path] += len(pages)
+                remaining[path] -= 1
+                if not remaining[path] and path not in failed:
+                    # recorded only once every page is in, so an interrupted or partly failed run re-indexes the file
+                    self.conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                                      (path, *found[path], page_counts[path]))
+        counts["failed"] = len(failed)
+        return counts
+
+    def search(self, query, limit=50, raw=False):
+        """Return (path, page, snippet) hits, best first. Each word is matched as a quoted term unless
+        raw=True, in which case the query is passed to FTS5 as is."""
+        if not raw:
+            query = " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+        if not query: return []
+        return self.conn.execute(
+            "SELECT path, page, snippet(pages, 0, '[', ']', '...', 12) FROM pages WHERE pages MATCH ? "
+            "ORDER BY rank LIMIT ?", (query, limit)).fetchall()
+
+class _GlyphWidths(dict):
+    """Per-character advance widths for one font and size, measured once and then looked up."""
+    def __init__(self, font, size):
+        super().__init__()
+        self.font, self.size = font, size
+
+    def __missing__(self, ch):
+        width = self[ch] = pdfmetrics.stringWidth(ch, self.font, self.size)
+        return width
+
+def _pdf_string(text):
+    data = text.encode("cp1252", "replace")
+    return b"(" + data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+class TextPdfWriter:
+    """Streams plain text into a PDF. Lines are wrapped by measured width (cached per glyph) and
+    each page's content stream is compressed and written to the file as soon as the page fills,
+    so the input can be any iterator of lines - an open file included - and memory stays flat.
+
+    font must be one of the standard 14 PDF fonts. header/footer are format strings with {page}
+    and {title} available."""
+    def __init__(self, output_path, pagesize=letter, font="Helvetica", fontsize=10, leading=None,
+                 margin=40, header=None, footer=None, title="", tab_size=4):
+        self.width, self.height = pagesize
+        self.font, self.fontsize = font, fontsize
+        self.leading = leading or fontsize * 1.2
+        self.margin, self.header, self.footer, self.title = margin, header, footer, title
+        self.tab_size = tab_size
+        self.top = self.height - margin - (self.leading if header else 0)
+        self.bottom = margin + (self.leading if footer else 0)
+        self.limit = self.width - 2 * margin
+        self.page, self.lines = 0, 0
+        self._widths, self._fonts, self._offsets, self._kids = {}, {}, {}, []
+        self._next_obj = 4  # 1 catalog, 2 page tree, 3 shared resources
+        self._content = None
+        self._owns_file = _is_path(output_path)
+        self._file = open(output_path, "wb") if self._owns_file else output_path
+        self._pos = 0
+        self._closed = False
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _write(self, data):
+        self._file.write(data)
+        self._pos += len(data)
+
+    def _obj(self, body, num=None):
+        if num is None:
+            num, self._next_obj = self._next_obj, self._next_obj + 1
+        self._offsets[num] = self._pos
+        self._write(b"%d 0 obj\n%s\nendobj\n" % (num, body))
+        return num
+
+    def _font_op(self, font, size):
+        name = self._fonts.setdefault(font, b"/F%d" % (len(self._fonts) + 1))
+        return b"%s %g Tf\n" % (name, size)
+
+    def _glyph_widths(self, font, size):
+        key = (font, size)
+        if key not in self._widths: self._widths[key] = _GlyphWidths(font, size)
+        return self._widths[key]
+
+    def _wrap(self, line, font, size):
+        cum = list(accumulate(map(self._glyph_widths(font, size).__getitem__, line)))
+        if not cum or cum[-1] <= self.limit:
+            yield line
+            return
+        start, base, n = 0, 0.0, len(line)
+        while start < n:
+            end = bisect_right(cum, base + self.limit, start)
+            if end >= n:
+                yield line[start:]
+                return
+            space = line.rfind(" ", start, end + 1)
+            if space > start:
+                yield line[start:space]
+                start = space + 1
+            else:
+                end = max(end, start + 1)
+                yield line[start:end]
+                start = end
+            base = cum[start - 1]
+
+    def _new_page(self):
+        self.page += 1
+        self._content = [b"BT\n", self._font_op(self.font, self.fontsize),
+                         b"%g TL %g %g Td\n" % (self.leading, self.margin, self.top + self.leading)]
+        self._y = self.top
+
+    def _finish_page(self):
+        parts = self._content
+        parts.append(b"ET\n")
+        fields = {"page": self.page, "title": self.title}
+        font = self._font_op(self.font, self.fontsize)
+        if self.header:
+            parts.append(b"BT %s%g %g Td %s Tj ET\n" % (font, self.margin, self.height - self.margin,
+                                                        _pdf_string(self.header.format(**fields))))
+        if self.footer:
+            text = self.footer.format(**fields)
+            x = (self.width - pdfmetrics.stringWidth(text, self.font, self.fontsize)) / 2
+            parts.append(b"BT %s%g %g Td %s Tj ET\n" % (font, x, self.margin, _pdf_string(text)))
+        data = zlib.compress(b"".join(parts))
+        contents = self._obj(b"<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream" % (len(data), data))
+        self._kids.append(self._obj(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %g %g] /Resources 3 0 R "
+                                    b"/Contents %d 0 R >>" % (self.width, self.height, contents)))
+        self._content = None
+
+    def write(self, line, font=None, fontsize=None):
+        font, fontsize = font or self.font, fontsize or self.fontsize
+        styled = (font, fontsize) != (self.font, self.fontsize)
+        line = line.rstrip("\r\n")
+        if "\t" in line: line = line.expandtabs(self.tab_size)
+        for piece in self._wrap(line, font, fontsize):
+            if self._content is None: self._new_page()
+            elif self._y < self.bottom:
+                self._finish_page()
+                self._new_page()
+            if styled:
+                self._content.append(b"%s%s '\n%s" % (self._font_op(font, fontsize), _pdf_string(piece),
+                                                      self._font_op(self.font, self.fontsize)))
+            else:
+                self._content.append(_pdf_string(piece) + b" '\n")
+            self._y -= self.leading
+        self.lines += 1
+
+    def write_lines(self, lines):
+        write = self.write
+        for line in lines: write(line)
+
+    def close(self):
+        if self._closed: return self.page
+        if self._content is None and not self.page: self._new_page()
+        if self._content is not None: self._finish_page()
+        fonts = b" ".join(b"%s %d 0 R" % (name, self._obj(
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>" % font.encode()))
+            for font, name in self._fonts.items())
+        self._obj(b"<< /Font << %s >> /ProcSet [/PDF /Text] >>" % fonts, 3)
+        kids = b" ".join(b"%d 0 R" % kid for kid in self._kids)
+        self._obj(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self._kids)), 2)
+        self._obj(b"<< /Type /Catalog /Pages 2 0 R >>", 1)
+        title = self.title.encode("utf-16-be").hex().encode()
+        info = self._obj(b"<< /Producer (pdf_utils) /Title <feff%s> >>" % title)
+        xref = self._pos
+        self._write(b"xref\n0 %d\n0000000000 65535 f \n" % self._next_obj)
+        self._write(b"".join(b"%010d 00000 n \n" % self._offsets[num] for num in range(1, self._next_obj)))
+        self._write(b"trailer\n<< /Size %d /Root 1 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                    % (self._next_obj, info, xref))
+        if self._owns_file: self._file.close()
+        self._closed = True
+        return self.page
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _text_lines(text_content):
+    return text_content.splitlines() if isinstance(text_content, str) else text_content
 
 def msg_to_pdf(input_path, output_path):
     if not extract_msg:
         raise ImportError("extract_msg library not available")
     msg = extract_msg.Message(input_path)
-    body = msg.body
-    sender = msg.sender
-    subject = msg.subject
-    c = canvas.Canvas(output_path, pagesize=letter)
-    width, height = letter
-    y = height - 50
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(40, y, f"Subject: {subject}")
-    y -= 20
-    c.drawString(40, y, f"From: {sender}")
-    y -= 30
-    c.setFont("Helvetica", 10)
-    text = c.beginText(40, y)
-    text.setFont("Helvetica", 10)
-    for line in body.split('\n'):
-        if y < 50:
-            c.drawText(text)
-            c.showPage()
-            y = height - 50
-            text = c.beginText(40, y)
-            text.setFont("Helvetica", 10)
-        text.textLine(line.strip())
-        y -= 12
-    c.drawText(text)
-    c.save()
-
-def merge_pdfs(file_list, output_path):
+    with TextPdfWriter(output_path, fontsize=10, leading=12, title=msg.subject or "", footer="{page}") as writer:
+        writer.write(f"Subject: {msg.subject}", font="Helvetica-Bold", fontsize=12)
+        writer.write(f"From: {msg.sender}", font="Helvetica-Bold", fontsize=12)
+        writer.write("")
+        writer.write_lines(line.strip() for line in (msg.body or "").splitlines())
+
+def _merge_stats(file_list, output_path, pages, start):
+    seconds = time.perf_counter() - start
+    bytes_in = sum(_source_size(p) for p in file_list)
+    return {"files": len(file_list), "pages": pages, "seconds": seconds,
+            "bytes_in": bytes_in, "bytes_out": _output_size(output_path),
+            "pages_per_second": pages / seconds if seconds else 0.0,
+            "mb_per_second": bytes_in / 1048576 / seconds if seconds else 0.0}
+
+def merge_pdfs(file_list, output_path, bookmarks=True, chunk_size=100, engine="fitz", dedupe=True):
+    """Merge PDFs with at most one source open at a time; returns throughput stats for the run.
+    The fitz engine flushes every chunk_size inputs with an incremental save so memory stays bounded,
+    then one final garbage=4 pass merges fonts and images shared between inputs."""
+    start = time.perf_counter()
+    with ExitStack() as stack:
+        file_list = [stack.enter_context(_pdf_input(pdf)) for pdf in file_list]
+        if engine == "pypdf":
+            return _merge_pypdf(file_list, output_path, bookmarks, start)
+        return _merge_fitz(file_list, output_path, bookmarks, chunk_size, dedupe, start)
+
+def _merge_pypdf(file_list, output_path, bookmarks, start):
     merger = PdfWriter()
-    for pdf in file_list:
-        merger.append(pdf)
+    for n, pdf in enumerate(file_list, 1):
+        name = _source_name(pdf, f"Document {n}") if bookmarks else None
+        merger.append(_input_stream(pdf), outline_item=name, import_outline=bookmarks)
+    pages = len(merger.pages)
     merger.write(output_path)
     merger.close()
+    return _merge_stats(file_list, output_path, pages, start)
 
-def split_pdf(input_path, output_dir):
-    reader = PdfReader(input_path)
-    base_name = os.path.splitext(os.path.basename(input_path))[0]
-    for i, page in enumerate(reader.pages):
-        writer = PdfWriter()
-        writer.add_page(page)
-        output_filename = f"{base_name}_page_{i+1}.pdf"
-        with open(os.path.join(output_dir, output_filename), "wb") as out:
-            writer.write(out)
-
-def pdf_to_word(input_path, output_path):
-    cv = Converter(input_path)
-    cv.convert(output_path, start=0, end=None)
-    cv.close()
-
-def pdf_to_images(input_path, output_dir):
-    doc = fitz.open(input_path)
-    base_name = os.path.splitext(os.path.basename(input_path))[0]
-    for i in range(len(doc)):
-        page = doc.load_page(i)
-        pix = page.get_pixmap()
-        output_file = os.path.join(output_dir, f"{base_name}_page_{i+1}.png")
-        pix.save(output_file)
-
-def images_to_pdf(image_list, output_path):
-    if not image_list: return
-    images = [Image.open(x).convert("RGB") for x in image_list]
-    images[0].save(output_path, save_all=True, append_images=images[1:])
+def _merge_fitz(file_list, output_path, bookmarks, chunk_size, dedupe, start):
+    toc, part_path = [], None
+    doc = fitz.open()
+    try:
+        for i in range(0, len(file_list), chunk_size):
+            if i:
+                # flush the chunks merged so far to a part file so memory stays bounded
+                if part_path is None:
+                    fd, part_path = tempfile.mkstemp(suffix=".pdf", dir=os.path.dirname(os.path.abspath(output_path))
+                                                     if _is_path(output_path) else None)
+                    os.close(fd)
+                    doc.save(part_path)
+                else:
+                    doc.save(part_path, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
+                doc.close()
+                doc = fitz.open(part_path)
+            for n, pdf in enumerate(file_list[i:i + chunk_size], i + 1):
+                with _open_fitz(pdf) as src:
+                    if bookmarks:
+                        offset = doc.page_count
+                        toc.append([1, _source_name(pdf, f"Document {n}"), offset + 1])
+                        # entries without a target (-1) keep none rather than pointing into the previous file
+                        toc.extend([lvl + 1, title, page + offset if page > 0 else -1]
+                                   for lvl, title, page in src.get_toc(simple=True))
+                    doc.insert_pdf(src)
+        pages = doc.page_count
+        if toc: doc.set_toc(toc)
+        doc.save(output_path, **(_SAVE_OPTIONS if dedupe else {}))
+    finally:
+        doc.close()
+        if part_path and os.path.exists(part_path): os.remove(part_path)
+    return _merge_stats(file_list, output_path, pages, start)
+
+def _page_resource_sizes(doc, font_sizes):
+    """Estimated stored bytes per xref for each page: content streams, images and embedded fonts."""
+    pages = []
+    for page in doc:
+        sizes = {x: len(doc.xref_stream_raw(x) or b"") for x in page.get_contents()}
+        for img in page.get_images(full=True):
+            if img[0] and img[0] not in sizes:
+                sizes[img[0]] = len(doc.xref_stream_raw(img[0]) or b"")
+        for font in page.get_fonts(full=True):
+            xref = font[0]
+            if xref not in font_sizes:
+                try: font_sizes[xref] = len(doc.extract_font(xref)[-1] or b"")
+                except Exception: font_sizes[xref] = 0
+            sizes[xref] = font_sizes[xref]
+        pages.append(sizes)
+    return pages
+
+def _split_groups(doc, ranges, every, bookmarks, max_bytes):
+    """Return (label, [page indices]) for every output part."""
+    n = len(doc)
+    if ranges:
+        if isinstance(ranges, str): ranges = ranges.split(";")
+        groups = [(spec.strip().replace(",", "_"), parse_page_range(spec, n)) for spec in ranges]
+        return [(f"pages_{label}", pages) for label, pages in groups if pages]
+    if bookmarks:
+        starts = {0: "front"}
+        for lvl, title, page in doc.get_toc(simple=True):
+            if lvl == 1 and 1 <= page <= n:
+                starts[page - 1] = re.sub(r"[^\w\- ]", "_", title).strip()[:60] or "part"
+        bounds = sorted(starts) + [n]
+        return [(f"{k+1:02d}_{starts[a]}", list(range(a, b))) for k, (a, b) in enumerate(zip(bounds, bounds[1:])) if b > a]
+    if max_bytes:
+        groups, current, seen, size = [], [], set(), 0
+        for i, sizes in enumerate(_page_resource_sizes(doc, {})):
+            extra = sum(v for x, v in sizes.items() if x not in seen)
+            if current and size + extra > max_bytes:
+                groups.append(current)
+                current, seen, size = [], set(), sum(sizes.values())
+            else:
+                size += extra
+            current.append(i)
+            seen.update(sizes)
+        if current: groups.append(current)
+        return [(f"part_{k+1}", pages) for k, pages in enumerate(groups)]
+    if every == 1:
+        return [(f"page_{i+1}", [i]) for i in range(n)]
+    return [(f"pages_{a+1}-{min(a+every, n)}", list(range(a, min(a + every, n)))) for a in range(0, n, every)]
 
-def compress_pdf(input_path, output_path):
+def _write_part(input_path, pages, output_path, prune):
+    with _worker_doc(input_path) as src, fitz.open() as out:
+        run_start = prev = pages[0]
+        for p in pages[1:] + [None]:
+            if p != prev + 1:
+                out.insert_pdf(src, from_page=run_start, to_page=prev)
+                run_start = p
+            prev = p
+        if prune:
+            for page in out:
+                page.clean_contents()
+        out.save(output_path, **_SAVE_OPTIONS)
+    return output_path
+
+def split_pdf(input_path, output_dir, ranges=None, every=1, bookmarks=False, max_bytes=None, prune=True, workers=None):
+    """Split by page ranges ("1-3;4-"), every N pages, top-level bookmarks or a target part size in bytes.
+    Parts are written concurrently and each keeps only the resources its pages actually use."""
+    with _pdf_input(input_path) as src:
+        base_name = _source_name(src)
+        with DOCUMENT_CACHE.fitz(src) as doc:
+            groups = _split_groups(doc, ranges, int(every), bookmarks, max_bytes)
+        jobs = [(src, pages, os.path.join(output_dir, f"{base_name}_{label}.pdf"), prune) for label, pages in groups]
+        return list(_pool_map(_write_part, jobs, workers))
+
+def _converter(src):
+    if not _is_memory(src): return Converter(src)
+    cv = Converter(stream=bytes(_memory_inputs[src]))
+    cv.filename_pdf = "document.pdf"  # store() records a file name
+    return cv
+
+def _parse_docx_pages(input_path, pages, settings):
+    cv = _converter(input_path)
     try:
-        initial_size = os.path.getsize(input_path)
-        doc = fitz.open(input_path)
-        for page in doc:
+        cv.parse(pages=pages, **settings)
+        return len(pages), cv.store()
+    finally:
+        cv.close()
+
+def pdf_to_word(input_path, output_path, pages=None, workers=None, chunk_size=None, progress=None):
+    """Parse page chunks in worker processes and build one docx from the stored page layouts.
+    progress(done_pages, total_pages) is called as each chunk finishes."""
+    with _pdf_input(input_path) as src:
+        _pdf_to_word(src, output_path, pages, workers, chunk_size, progress)
+
+def _pdf_to_word(input_path, output_path, pages, workers, chunk_size, progress):
+    cv = _converter(input_path)
+    try:
+        indices = parse_page_range(pages, len(cv.fitz_doc))
+        settings = cv.default_settings
+        workers = _worker_count(workers, len(indices))
+        if not chunk_size: chunk_size = max(1, math.ceil(len(indices) / (workers * 4)))
+        jobs = [(input_path, indices[i:i + chunk_size], settings) for i in range(0, len(indices), chunk_size)]
+        done = 0
+        for count, data in _pool_map(_parse_docx_pages, jobs, workers, ordered=False):
+            cv.restore(data)
+            done += count
+            if progress: progress(done, len(indices))
+        cv.make_docx(output_path, **settings)
+    finally:
+        cv.close()
+
+def parse_page_range(spec, page_count):
+    """Turn a selector like "1-5,9,12-" (or a list of 1-based numbers) into 0-based page indices.
+    None selects every page, an empty selector none. Only a range with both ends, like "5-2", runs backwards."""
+    if spec is None:
+        return list(range(page_count))
+    if isinstance(spec, str):
+        pages = []
+        for part in spec.replace(" ", "").split(","):
+            if not part: continue
+            if "-" in part:
+                start, end = part.split("-", 1)
+                if start and end and int(end) < int(start):
+                    pages.extend(range(int(start), int(end) - 1, -1))
+                else:
+                    pages.extend(range(int(start) if start else 1, (int(end) if end else page_count) + 1))
+            else:
+                pages.append(int(part))
+    else:
+        pages = list(spec)
+    return [p - 1 for p in pages if 1 <= p <= page_count]
+
+def _worker_count(workers, jobs):
+    if workers is None: workers = os.cpu_count() or 1
+    return max(1, min(int(workers), jobs))
+
+# Anywhere this module takes an input path it also takes bytes, bytearray, memoryview, mmap or a binary
+# file object. _pdf_input registers those under a key that stands in for the path everywhere, pool
+# workers included; outputs take a path or a binary file object.
+MMAP_THRESHOLD = 32 * 1024 * 1024
+_memory_inputs = {}
+_memory_filenos = {}
+_memory_paths = {}
+_memory_files = {}
+_memory_ids = count(1)
+
+def _is_path(obj):
+    return isinstance(obj, (str, os.PathLike))
+
+def _is_memory(src):
+    return isinstance(src, str) and src in _memory_inputs
+
+def _add_memory_inputs(inputs, mapped=None):
+    _memory_inputs.update(inputs)
+    for key, path in (mapped or {}).items():
+        # kept open for the worker's lifetime, _input_stream maps it again for pypdf and pdfplumber
+        f = _memory_files[key] = open(path, "rb")
+        _memory_inputs[key] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _memory_filenos[key] = f.fileno()
+
+@contextmanager
+def _pdf_input(src):
+    if _is_path(src):
+        yield os.fspath(src)
+        return
+    key = f"<memory:{os.getpid()}:{next(_memory_ids)}>"
+    if isinstance(src, (bytes, bytearray, memoryview, mmap.mmap)):
+        _memory_inputs[key] = src
+    elif isinstance(src, BytesIO):
+        _memory_inputs[key] = src.getvalue()
+    else:
+        try:
+            fileno = src.fileno()
+            large = os.fstat(fileno).st_size >= MMAP_THRESHOLD
+        except (AttributeError, OSError, ValueError):
+            large = False
+        # big files are mapped rather than read, so only the pages actually parsed are paged in
+        if large:
+            _memory_inputs[key] = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+            _memory_filenos[key] = fileno
+            name = getattr(src, "name", None)
             try:
-                img_list = page.get_images(full=True)
-                for img in img_list:
-                    xref = img[0]
-                    if xref == 0: continue
-                    base = doc.extract_image(xref)
-                    if not base: continue
-                    if len(base["image"]) < 5120: continue
-                    try:
-                        pil_img = Image.open(BytesIO(base["image"]))
-                    except: continue
-                    max_dim = 1000
-                    scale = 1.0
-                    w, h = pil_img.size
-                    if max(w, h) > max_dim:
-                        scale = max_dim / max(w, h)
-                        new_w = int(w * scale)
-                        new_h = int(h * scale)
-                        pil_img = pil_img.resize((new_w, new_h), Image.LANCZOS)
-                    out_buffer = BytesIO()
-                    if pil_img.mode in ("RGBA", "LA"):
-                        bg = Image.new("RGB", pil_img.size, (255, 255, 255))
-                        bg.paste(pil_img, mask=pil_img.split()[-1])
-                        pil_img = bg
-                    elif pil_img.mode == "P":
-                         pil_img = pil_img.convert("RGB")
-                    if pil_img.mode == "L": cs = "/DeviceGray"
-                    else: cs = "/DeviceRGB"; pil_img = pil_img.convert("RGB")
-                    pil_img.save(out_buffer, format="JPEG", quality=50, optimize=True)
-                    new_bytes = out_buffer.getvalue()
-                    if len(new_bytes) < len(base["image"]):
-                        doc.update_stream(xref, new_bytes)
-                        if hasattr(doc, "xref_set_key"):
-                            doc.xref_set_key(xref, "Filter", "/DCTDecode")
-                            doc.xref_set_key(xref, "Width", pil_img.width)
-                            doc.xref_set_key(xref, "Height", pil_img.height)
-                            doc.xref_set_key(xref, "ColorSpace", cs)
-                            doc.xref_set_key(xref, "BitsPerComponent", 8)
-            except Exception: pass
-        doc.save(output_path, garbage=4, deflate=True)
-        if os.path.exists(output_path):
-            if os.path.getsize(output_path) >= initial_size:
+                # pool workers can map the same file by name instead of being sent a copy
+                if isinstance(name, str) and os.path.samestat(os.stat(name), os.fstat(fileno)):
+                    _memory_paths[key] = name
+            except OSError:
+                pass
+        else:
+            _memory_inputs[key] = src.read()
+    try:
+        yield key
+    finally:
+        DOCUMENT_CACHE.forget(key)
+        _memory_filenos.pop(key, None)
+        _memory_paths.pop(key, None)
+        _memory_inputs.pop(key, None)
+
+def _open_fitz(src):
+    """A private fitz document for a path or in-memory key, free to be edited."""
+    if _is_memory(src): return fitz.open("pdf", memoryview(_memory_inputs[src]))
+    return fitz.open(src)
+
+def _same_file(a, b):
+    return _is_path(a) and _is_path(b) and os.path.exists(b) and os.path.samefile(a, b)
+
+@contextmanager
+def _edited_pdf(src, output_path, incremental=False, **save_options):
+    """A private fitz document for src, saved to output_path on exit. Saving onto the input file, or
+    incremental=True between two paths, appends only the changed objects to output_path (after a kernel
+    copy of the input when they differ) instead of re-serialising the whole file. When the document
+    can't take an incremental update it is rewritten in full, through a temp file when in place."""
+    in_place = _is_path(output_path) and _is_path(src) and (incremental or _same_file(src, output_path))
+    # a cached copy would keep the file open, which blocks replacing it on Windows
+    if _is_path(output_path): DOCUMENT_CACHE.forget(output_path)
+    if in_place and not _same_file(src, output_path):
+        shutil.copyfile(src, output_path)
+    doc = _open_fitz(os.fspath(output_path) if in_place else src)
+    try:
+        yield doc
+        if not in_place:
+            doc.save(output_path, **save_options)
+        elif doc.can_save_incrementally():
+            doc.save(doc.name, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
+        else:
+            tmp = f"{output_path}.{os.getpid()}.tmp"
+            try:
+                doc.save(tmp, **save_options)
                 doc.close()
-                doc2 = fitz.open(input_path)
-                doc2.save(output_path, garbage=4, deflate=True)
-                doc2.close()
+                os.replace(tmp, output_path)
+            finally:
+                if os.path.exists(tmp): os.remove(tmp)
+    finally:
+        if not doc.is_closed: doc.close()
+
+def _input_stream(src):
+    """A path or a seekable binary stream of its own, for pypdf and pdfplumber."""
+    if not _is_memory(src): return src
+    if src in _memory_filenos: return mmap.mmap(_memory_filenos[src], 0, access=mmap.ACCESS_READ)
+    return BytesIO(_memory_inputs[src])
+
+def _source_name(src, default="document"):
+    return default if _is_memory(src) else os.path.splitext(os.path.basename(src))[0]
+
+def _source_size(src):
+    return len(_memory_inputs[src]) if _is_memory(src) else os.path.getsize(src)
+
+def _output_size(output):
+    if _is_path(output): return os.path.getsize(output)
+    try: return output.tell()
+    except (AttributeError, OSError): return None
+
+def _write_output(output, data):
+    if _is_path(output):
+        DOCUMENT_CACHE.forget(output)
+        with open(output, "wb") as f: f.write(data)
+    else:
+        output.write(data)
+
+@contextmanager
+def _text_output(output, newline=None):
+    """Text file for a path, a text stream as is, or a UTF-8 wrapper around a binary stream."""
+    if _is_path(output):
+        with open(output, "w", encoding="utf-8", newline=newline) as f: yield f
+    elif isinstance(output, TextIOBase):
+        yield output
+    else:
+        f = TextIOWrapper(output, encoding="utf-8", newline=newline)
+        try:
+            yield f
+        finally:
+            f.flush()
+            f.detach()
+
+class DocumentCache:
+    """LRU cache of parsed documents shared by the fitz and pypdf code paths. Entries are keyed by
+    (backend, path, size, mtime, inode), so a file changed on disk is reparsed rather than served stale,
+    and evicted once their combined file size exceeds max_bytes or there are more than max_docs.
+    In-memory inputs are cached under their key while _pdf_input holds them.
+
+    Cached documents are shared: fitz() and pypdf() are context managers that hold the entry's lock for
+    the with block, as neither library copes with one document used from two threads at once. Treat the
+    documents as read-only and never close them; code that edits a document opens its own copy.
+    Evicted and forgotten documents are closed, by their last user if one is still in a with block, so
+    no file handle outlives its entry; forget() a path before replacing or deleting the file."""
+    def __init__(self, max_bytes=512 * 1024 * 1024, max_docs=8):
+        self.max_bytes, self.max_docs = max_bytes, max_docs
+        self.hits = self.misses = self.evictions = 0
+        self._entries = OrderedDict()  # key -> [document, size, lock, users]
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+    def fitz(self, src):
+        return self._use("fitz", src, _open_fitz)
+
+    def pypdf(self, src):
+        return self._use("pypdf", src, lambda s: PdfReader(_input_stream(s)))
+
+    @contextmanager
+    def _use(self, backend, src, opener):
+        key, entry = self._get(backend, src, opener)
+        try:
+            with entry[2]:
+                yield entry[0]
+        finally:
+            with self._lock:
+                entry[3] -= 1
+                if not entry[3] and self._entries.get(key) is not entry: entry[0].close()
+
+    def _get(self, backend, src, opener):
+        if _is_memory(src):
+            key, size = (backend, src), len(_memory_inputs[src])
+        else:
+            src = os.path.abspath(src)
+            st = os.stat(src)
+            key, size = (backend, src, st.st_size, st.st_mtime_ns, st.st_ino), st.st_size
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+                # an older version of the same file can never be hit again
+                for old in [k for k in self._entries if k[:2] == key[:2]]:
+                    self._drop(old)
+                entry = self._entries[key] = [opener(src), size, threading.RLock(), 0]
+                self._bytes += size
+                while len(self._entries) > 1 and (self._bytes > self.max_bytes or len(self._entries) > self.max_docs):
+                    self._drop(next(iter(self._entries)))
+                    self.evictions += 1
+            entry[3] += 1
+            return key, entry
+
+    def _drop(self, key):
+        doc, size, _, users = self._entries.pop(key)
+        self._bytes -= size
+        # a document still in a with block is closed by its last user on the way out
+        if not users: doc.close()
+
+    def forget(self, src):
+        if not _is_memory(src): src = os.path.abspath(src)
+        with self._lock:
+            for key in [k for k in self._entries if k[1] == src]:
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._drop(key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "hit_rate": self.hits / lookups if lookups else 0.0,
+                    "documents": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+# one per process: pool workers get their own, so each worker parses an input once
+DOCUMENT_CACHE = DocumentCache()
+
+def _worker_doc(path):
+    return DOCUMENT_CACHE.fitz(path)
+
+def page_count(input_path):
+    with _pdf_input(input_path) as src, DOCUMENT_CACHE.fitz(src) as doc:
+        return len(doc)
+
+def pdf_thumbnail(input_path, max_size=(300, 300), page=0):
+    """First page (by default) rendered just large enough for max_size, as a PIL image."""
+    with _pdf_input(input_path) as src, DOCUMENT_CACHE.fitz(src) as doc:
+        return _thumbnail(doc, max_size, page)
+
+def _thumbnail(doc, max_size, page):
+    rect = doc[page].rect
+    zoom = min(max_size[0] / rect.width, max_size[1] / rect.height)
+    pix = doc[page].get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+    return _samples_to_image(pix.width, pix.height, pix.n, pix.samples)
+
+def _pool_map(fn, jobs, workers=None, ordered=True, window=None):
+    """Run fn(*args) for every job tuple in a process pool, yielding results as they finish.
+    At most `window` jobs (default two per worker) are in flight, so results never pile up in memory."""
+    jobs = list(jobs)
+    workers = _worker_count(workers, len(jobs))
+    if workers == 1:
+        for args in jobs:
+            yield fn(*args)
+        return
+    # in-memory inputs travel to each worker once, not with every job. Mapped inputs are never copied
+    # into the parent: workers map the backing file, or a single temp copy when it has no usable name.
+    keys = {arg for args in jobs for arg in args if _is_memory(arg)}
+    memory, mapped, spilled = {}, {}, []
+    try:
+        for key in keys:
+            data = _memory_inputs[key]
+            if not isinstance(data, mmap.mmap):
+                memory[key] = bytes(data)
+            elif key in _memory_paths:
+                mapped[key] = _memory_paths[key]
+            else:
+                with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+                    spilled.append(tmp.name)
+                    tmp.write(data)
+                mapped[key] = tmp.name
+        initializer = (_add_memory_inputs, (memory, mapped)) if keys else (None, ())
+        with ProcessPoolExecutor(max_workers=workers, initializer=initializer[0], initargs=initializer[1]) as pool:
+            job_iter = iter(jobs)
+            pending = deque(pool.submit(fn, *args) for args in islice(job_iter, window or workers * 2))
+            try:
+                while pending:
+                    if ordered:
+                        fut = pending.popleft()
+                    else:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        fut = done.pop()
+                        pending.remove(fut)
+                    result = fut.result()
+                    for args in islice(job_iter, 1):
+                        pending.append(pool.submit(fn, *args))
+                    yield result
+            finally:
+                for fut in pending: fut.cancel()
+    finally:
+        for path in spilled: os.remove(path)
+
+_IMAGE_FORMATS = {"png": "PNG", "jpg": "JPEG", "jpeg": "JPEG", "webp": "WEBP"}
+
+def _samples_to_image(width, height, n, samples):
+    mode = {1: "L", 2: "LA", 3: "RGB", 4: "RGBA"}[n]
+    return Image.frombytes(mode, (width, height), samples)
+
+def _render_page(doc, index, opts):
+    fmt = opts["fmt"]
+    alpha = opts["alpha"] and fmt in ("png", "webp", "raw")
+    colorspace = fitz.csGRAY if opts["grayscale"] else fitz.csRGB
+    pix = doc.load_page(index).get_pixmap(dpi=opts["dpi"], colorspace=colorspace, alpha=alpha)
+    if fmt == "raw":
+        return (pix.width, pix.height, pix.n, pix.samples)
+    if fmt == "png" and not opts["encoder"]:
+        return pix.tobytes("png")
+    buf = BytesIO()
+    encoder = dict(opts["encoder"] or {})
+    if fmt != "png": encoder.setdefault("quality", opts["quality"])
+    _samples_to_image(pix.width, pix.height, pix.n, pix.samples).save(buf, format=_IMAGE_FORMATS[fmt], **encoder)
+    return buf.getvalue()
+
+def _render_batch(input_path, indices, opts, output_dir, name_prefix):
+    results = []
+    for i in indices:
+        with _worker_doc(input_path) as doc:
+            data = _render_page(doc, i, opts)
+        if output_dir:
+            ext = "jpg" if opts["fmt"] == "jpeg" else opts["fmt"]
+            out = os.path.join(output_dir, f"{name_prefix}_page_{i+1}.{ext}")
+            with open(out, "wb") as f:
+                f.write(data)
+            data = out
+        results.append((i, data))
+    return results
+
+def render_pages(input_path, pages=None, dpi=72, fmt="png", grayscale=False, alpha=False, quality=85,
+                 encoder=None, output_dir=None, name_prefix=None, workers=None, ordered=True, batch_size=4,
+                 window=None):
+    """Render PDF pages across a process pool, each worker holding its own fitz document.
+    Yields (page_index, data) as pages finish: data is the encoded image bytes, the written
+    file path when output_dir is given, or (width, height, n, samples) for fmt="raw"."""
+    fmt = fmt.lower()
+    if fmt not in _IMAGE_FORMATS and fmt != "raw":
+        raise ValueError(f"Unsupported image format: {fmt}")
+    with _pdf_input(input_path) as src:
+        indices = parse_page_range(pages, page_count(src))
+        if name_prefix is None: name_prefix = _source_name(src)
+        opts = {"fmt": fmt, "dpi": dpi, "grayscale": grayscale, "alpha": alpha, "quality": quality, "encoder": encoder}
+        jobs = [(src, indices[i:i + batch_size], opts, output_dir, name_prefix)
+                for i in range(0, len(indices), batch_size)]
+        for batch in _pool_map(_render_batch, jobs, workers, ordered, window):
+            yield from batch
+
+def pdf_to_images(input_path, output_dir, dpi=72, fmt="png", pages=None, grayscale=False, quality=85,
+                  encoder=None, name_prefix=None, workers=None):
+    results = render_pages(input_path, pages=pages, dpi=dpi, fmt=fmt, grayscale=grayscale, quality=quality,
+                           encoder=encoder, output_dir=output_dir, name_prefix=name_prefix, workers=workers,
+                           ordered=False)
+    return [path for _, path in sorted(results)]
+
+_PASSTHROUGH_FORMATS = ("JPEG", "JPEG2000")
+_NATIVE_FORMATS = ("PNG", "GIF", "BMP")
+
+def _needs_decode(img):
+    if img.format in _PASSTHROUGH_FORMATS: return False
+    has_alpha = img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+    return img.format not in _NATIVE_FORMATS or has_alpha
+
+def _image_source(image):
+    return BytesIO(image) if isinstance(image, (bytes, bytearray, memoryview)) else image
+
+def _pdf_image_stream(path, quality):
+    """Return (width, height, stream) for page.insert_image, decoding only images fitz can't embed as is.
+    path may also be the image bytes."""
+    with Image.open(_image_source(path)) as img:
+        w, h = img.size
+        if not _needs_decode(img):
+            if not _is_path(path): return w, h, bytes(path)
+            with open(path, "rb") as f:
+                return w, h, f.read()
+        lossless = img.format in _NATIVE_FORMATS
+        if img.mode in ("RGBA", "LA", "PA", "P"):
+            img = img.convert("RGBA")
+            bg = Image.new("RGB", img.size, (255, 255, 255))
+            bg.paste(img, mask=img.split()[-1])
+            img = bg
+        elif img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        buf = BytesIO()
+        if lossless: img.save(buf, format="PNG")
+        else: img.save(buf, format="JPEG", quality=quality)
+        return w, h, buf.getvalue()
+
+def images_to_pdf(image_list, output_path, quality=90, workers=None):
+    """JPEG/JPEG2000 streams are embedded untouched; other inputs are decoded in a pool only when needed.
+    Images are paths, bytes or binary file objects."""
+    if not image_list: return
+    # file objects are read once here: the scan below would consume them, and they can't go to the pool
+    image_list = [image if _is_path(image) or isinstance(image, (bytes, bytearray, memoryview)) else image.read()
+                  for image in image_list]
+    decode_count = 0
+    for path in image_list:
+        with Image.open(_image_source(path)) as img:
+            decode_count += _needs_decode(img)
+    if not decode_count: workers = 1
+    doc = fitz.open()
+    try:
+        for w, h, stream in _pool_map(_pdf_image_stream, [(p, quality) for p in image_list], workers):
+            page = doc.new_page(width=w, height=h)
+            page.insert_image(page.rect, stream=stream)
+        doc.save(output_path, garbage=3, deflate=True)
+    finally:
+        doc.close()
+
+# garbage=4 merges byte-identical objects and streams; object streams also compress the xref table
+_SAVE_OPTIONS = {"garbage": 4, "deflate": True, "use_objstms": True}
+
+def _duplicate_streams(doc):
+    """Return (count, bytes) of streams identical to an earlier one, i.e. what garbage=4 will merge."""
+    seen, count, size = set(), 0, 0
+    for xref in range(1, doc.xref_length()):
+        if not doc.xref_is_stream(xref): continue
+        raw = doc.xref_stream_raw(xref) or b""
+        digest = hashlib.sha1(doc.xref_object(xref, compressed=True).encode() + raw).digest()
+        if digest in seen:
+            count += 1
+            size += len(raw)
+        else:
+            seen.add(digest)
+    return count, size
+
+def _optimize_structure(doc, subset_fonts=True, prune_resources=False):
+    if prune_resources:
+        for page in doc:
+            page.clean_contents()
+    if subset_fonts:
+        try:
+            doc.subset_fonts()
+        except Exception:
+            pass # needs fontTools; fonts are kept whole without it
+
+def optimize_pdf(input_path, output_path, subset_fonts=True, prune_resources=True):
+    """Structural size pass: merge identical streams, subset embedded fonts to the glyphs used,
+    drop unused page resources and write object streams with a compressed xref table."""
+    with _pdf_input(input_path) as src, _open_fitz(src) as doc:
+        dup_count, dup_bytes = _duplicate_streams(doc)
+        _optimize_structure(doc, subset_fonts, prune_resources)
+        doc.save(output_path, **_SAVE_OPTIONS)
+        bytes_before = _source_size(src)
+    return {"duplicate_streams": dup_count, "duplicate_bytes": dup_bytes,
+            "bytes_before": bytes_before, "bytes_after": _output_size(output_path)}
+
+def _placed_image_sizes(doc):
+    """Map every unique image xref to the largest (width, height) in points it is drawn at."""
+    sizes, smasks = {}, set()
+    for page in doc:
+        for img in page.get_images(full=True):
+            if img[0]: sizes.setdefault(img[0], None)
+            if img[1]: smasks.add(img[1])
+        for info in page.get_image_info(xrefs=True):
+            xref = info.get("xref")
+            if not xref: continue
+            a, b, c, d = info["transform"][:4]
+            w, h = math.hypot(a, b), math.hypot(c, d)
+            prev = sizes.get(xref) or (0, 0)
+            sizes[xref] = (max(prev[0], w), max(prev[1], h))
+    for xref in smasks: sizes.pop(xref, None)
+    return sizes
+
+def _is_gray(img, tolerance=8):
+    r, g, b = img.split()
+    return (ImageChops.difference(r, g).getextrema()[1] <= tolerance
+            and ImageChops.difference(g, b).getextrema()[1] <= tolerance)
+
+def _is_bilevel(img, share=0.99):
+    hist = img.histogram()
+    return sum(hist[:32]) + sum(hist[224:]) >= share * img.width * img.height
+
+def _recompress_image(input_path, xref, placed, target_dpi, quality, detect_gray):
+    with _worker_doc(input_path) as doc:
+        old_size = len(doc.xref_stream_raw(xref) or b"")
+        if old_size < 5120: return None
+        base = doc.extract_image(xref)
+    if not base: return None
+    try:
+        pil_img = Image.open(BytesIO(base["image"]))
+        pil_img.load()
+    except Exception: return None
+    if pil_img.mode in ("RGBA", "LA"):
+        bg = Image.new("RGB", pil_img.size, (255, 255, 255))
+        bg.paste(pil_img, mask=pil_img.split()[-1])
+        pil_img = bg
+    elif pil_img.mode not in ("RGB", "L"):
+        pil_img = pil_img.convert("RGB")
+    if detect_gray and pil_img.mode == "RGB" and _is_gray(pil_img):
+        pil_img = pil_img.convert("L")
+    bilevel = detect_gray and pil_img.mode == "L" and _is_bilevel(pil_img)
+    w, h = pil_img.size
+    scale = 1.0
+    if placed and target_dpi:
+        scale = min(1.0, placed[0] * target_dpi / 72 / w, placed[1] * target_dpi / 72 / h)
+        # Text in bilevel scans needs more pixels than photos to stay legible
+        if bilevel: scale = min(1.0, scale * 2)
+    if scale < 1.0:
+        pil_img = pil_img.resize((max(1, int(w * scale)), max(1, int(h * scale))), Image.LANCZOS)
+    if bilevel:
+        pil_img = pil_img.convert("1", dither=Image.NONE)
+        new_bytes, filt, bpc = zlib.compress(pil_img.tobytes(), 9), "/FlateDecode", 1
+    else:
+        out_buffer = BytesIO()
+        pil_img.save(out_buffer, format="JPEG", quality=quality, optimize=True)
+        new_bytes, filt, bpc = out_buffer.getvalue(), "/DCTDecode", 8
+    if len(new_bytes) >= old_size: return None
+    cs = "/DeviceRGB" if pil_img.mode == "RGB" else "/DeviceGray"
+    return xref, old_size, new_bytes, pil_img.width, pil_img.height, cs, filt, bpc
+
+def compress_pdf(input_path, output_path, target_dpi=150, quality=50, detect_gray=True, subset_fonts=True,
+                 prune_resources=False, workers=None):
+    """Recompress each unique image xref once, sized to its placed dimensions at target_dpi.
+    Returns {xref: (bytes_before, bytes_after)} for every image that was replaced."""
+    with _pdf_input(input_path) as src:
+        return _compress(src, output_path, target_dpi, quality, detect_gray, subset_fonts, prune_resources, workers)
+
+def _compress(input_path, output_path, target_dpi, quality, detect_gray, subset_fonts, prune_resources, workers):
+    report = {}
+    try:
+        initial_size = _source_size(input_path)
+        doc = _open_fitz(input_path)
+        jobs = [(input_path, xref, placed, target_dpi, quality, detect_gray)
+                for xref, placed in _placed_image_sizes(doc).items()]
+        for result in _pool_map(_recompress_image, jobs, workers, ordered=False):
+            if not result: continue
+            xref, old_size, new_bytes, w, h, cs, filt, bpc = result
+            doc.update_stream(xref, new_bytes, compress=False)
+            doc.xref_set_key(xref, "Filter", filt)
+            doc.xref_set_key(xref, "DecodeParms", "null")
+            doc.xref_set_key(xref, "Decode", "null")
+            doc.xref_set_key(xref, "Width", str(w))
+            doc.xref_set_key(xref, "Height", str(h))
+            doc.xref_set_key(xref, "ColorSpace", cs)
+            doc.xref_set_key(xref, "BitsPerComponent", str(bpc))
+            report[xref] = (old_size, len(new_bytes))
+        _optimize_structure(doc, subset_fonts, prune_resources)
+        # built in memory first: the result is only kept if it actually came out smaller
+        buf = BytesIO()
+        doc.save(buf, **_SAVE_OPTIONS)
+        doc.close()
+        if buf.tell() >= initial_size:
+            report = {}
+            with _open_fitz(input_path) as doc2:
+                doc2.save(output_path, **_SAVE_OPTIONS)
+        else:
+            _write_output(output_path, buf.getbuffer())
     except Exception as e:
         try:
-            doc = fitz.open(input_path)
-            doc.save(output_path, garbage=4, deflate=True)
+            with _open_fitz(input_path) as doc:
+                doc.save(output_path, **_SAVE_OPTIONS)
         except:
              raise Exception(f"Failed to compress PDF: {str(e)}")
+    return report
 
-def pdf_to_excel(input_path, output_path):
-    with pdfplumber.open(input_path) as pdf:
-        all_tables = []
-        for page in pdf.pages:
+def _extract_tables(input_path, indices, backend):
+    results = []
+    if backend == "fitz":
+        with _worker_doc(input_path) as doc:
+            for i in indices:
+                start = time.perf_counter()
+                tables = [t.extract() for t in doc[i].find_tables().tables]
+                results.append((i, tables, time.perf_counter() - start))
+        return results
+    with pdfplumber.open(_input_stream(input_path)) as pdf:
+        for i in indices:
+            start = time.perf_counter()
+            page = pdf.pages[i]
             tables = page.extract_tables()
-            for table in tables:
-                df = pd.DataFrame(table)
-                all_tables.append(df)
-    if all_tables:
-        with pd.ExcelWriter(output_path) as writer:
-            for i, df in enumerate(all_tables):
-                df.to_excel(writer, sheet_name=f"Table_{i+1}", index=False)
-    else:
-        pd.DataFrame().to_excel(output_path)
-
-def crop_pdf(input_path, output_path, margins):
-    reader = PdfReader(input_path)
-    writer = PdfWriter()
-    for page in reader.pages:
-        x0 = page.cropbox.lower_left[0]
-        y0 = page.cropbox.lower_left[1]
-        x1 = page.cropbox.upper_right[0]
-        y1 = page.cropbox.upper_right[1]
-        left, top, right, bottom = margins
-        new_x0 = x0 + left
-        new_y0 = y0 + bottom
-        new_x1 = x1 - right
-        new_y1 = y1 - top
-        if new_x1 > new_x0 and new_y1 > new_y0:
-            page.cropbox.lower_left = (new_x0, new_y0)
-            page.cropbox.upper_right = (new_x1, new_y1)
-        writer.add_page(page)
-    writer.write(output_path)
-
-def rearrange_pdf(input_path, output_path, page_order):
-    reader = PdfReader(input_path)
-    writer = PdfWriter()
-    total_pages = len(reader.pages)
-    for p_num in page_order:
-        if 1 <= p_num <= total_pages:
-            writer.add_page(reader.pages[p_num-1])
-    writer.write(output_path)
-
-def pdf_to_ppt(input_path, output_path):
-    doc = fitz.open(input_path)
+            page.close()
+            results.append((i, tables, time.perf_counter() - start))
+    return results
+
+def iter_tables(input_path, pages=None, backend="pdfplumber", workers=None, batch_size=8, stats=None):
+    """Extract tables across a process pool, yielding (page_index, tables) in page order.
+    backend="fitz" uses PyMuPDF's find_tables, which is usually much faster than pdfplumber.
+    Pass a dict as stats to collect per-page timings."""
+    if backend not in ("pdfplumber", "fitz"):
+        raise ValueError(f"Unknown table backend: {backend}")
+    with _pdf_input(input_path) as src:
+        indices = parse_page_range(pages, page_count(src))
+        jobs = [(src, indices[i:i + batch_size], backend) for i in range(0, len(indices), batch_size)]
+        if stats is not None:
+            stats.update({"pages": len(indices), "tables": 0, "page_seconds": {}})
+        start = time.perf_counter()
+        for batch in _pool_map(_extract_tables, jobs, workers):
+            for i, tables, seconds in batch:
+                if stats is not None:
+                    stats["tables"] += len(tables)
+                    stats["page_seconds"][i + 1] = seconds
+                yield i, tables
+    if stats is not None:
+        stats["seconds"] = time.perf_counter() - start
+
+def pdf_to_excel(input_path, output_path, pages=None, backend="pdfplumber", workers=None):
+    """One sheet per table, streamed through a write-only workbook. Returns extraction stats."""
+    stats = {}
+    wb = Workbook(write_only=True)
+    count = 0
+    for _, tables in iter_tables(input_path, pages, backend, workers, stats=stats):
+        for table in tables:
+            count += 1
+            ws = wb.create_sheet(f"Table_{count}")
+            for row in table:
+                ws.append(row)
+    if not count: wb.create_sheet("Sheet1")
+    wb.save(output_path)
+    return stats
+
+def crop_pdf(input_path, output_path, margins, pages=None, incremental=False):
+    PageOps(input_path).crop(margins, pages).save(output_path, incremental)
+
+def rearrange_pdf(input_path, output_path, page_order, incremental=False):
+    PageOps(input_path).reorder(page_order).save(output_path, incremental)
+
+def pdf_to_ppt(input_path, output_path, dpi=150, workers=None):
     prs = Presentation()
     blank_slide_layout = prs.slide_layouts[6]
-    for i in range(len(doc)):
-        page = doc.load_page(i)
-        pix = page.get_pixmap(dpi=150)
-        img_data = pix.tobytes("png")
+    for _, img_data in render_pages(input_path, dpi=dpi, workers=workers):
         slide = prs.slides.add_slide(blank_slide_layout)
         stream = BytesIO(img_data)
         slide.shapes.add_picture(stream, 0, 0, width=prs.slide_width, height=prs.slide_height)
     prs.save(output_path)
 
-def url_to_pdf(url, output_path):
+URL_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".pdf_studio_http_cache")
+
+def http_session(retries=3, pool_size=16, backoff=0.5):
+    """requests.Session with pooled keep-alive connections, retrying connection errors and 429/5xx."""
+    session = requests.Session()
+    retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=("GET", "HEAD"))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = "pdf-studio"
+    return session
+
+class HttpCache:
+    """Response bodies kept on disk and revalidated with ETag / Last-Modified, so repeat runs only
+    download what changed. Safe to share between fetch threads."""
+    def __init__(self, cache_dir=URL_CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.stats = {"downloaded": 0, "revalidated": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, key):
+        with self._lock: self.stats[key] += 1
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, key + ".json"), os.path.join(self.cache_dir, key + ".body")
+
+    def get(self, session, url, timeout=15):
+        """Return (body, content_type, final_url)."""
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, encoding="utf-8") as f: meta = json.load(f)
+        except (OSError, ValueError):
+            meta = None
+        headers = {}
+        if meta:
+            if meta.get("etag"): headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"): headers["If-Modified-Since"] = meta["last_modified"]
+        res = session.get(url, headers=headers, timeout=timeout)
+        if res.status_code == 304 and meta:
+            try:
+                with open(body_path, "rb") as f: body = f.read()
+                self._count("revalidated")
+                return body, meta["content_type"], meta["url"]
+            except OSError:
+                res = session.get(url, timeout=timeout)
+        res.raise_for_status()
+        self._count("downloaded")
+        etag, modified = res.headers.get("ETag"), res.headers.get("Last-Modified")
+        if etag or modified:
+            # body first, metadata last: a reader never finds metadata pointing at a missing body
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir)
+            with os.fdopen(fd, "wb") as f: f.write(res.content)
+            os.replace(tmp, body_path)
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"etag": etag, "last_modified": modified, "url": res.url,
+                           "content_type": res.headers.get("Content-Type", "")}, f)
+            os.replace(tmp, meta_path)
+        return res.content, res.headers.get("Content-Type", ""), res.url
+
+def _http_get(session, cache, url, timeout):
+    if cache: return cache.get(session, url, timeout)
+    res = session.get(url, timeout=timeout)
+    res.raise_for_status()
+    return res.content, res.headers.get("Content-Type", ""), res.url
+
+def _data_uri(body, mime):
+    return f"data:{mime};base64,{base64.b64encode(body).decode('ascii')}"
+
+def _fetch_all(pool, fetch, urls):
+    """Fetch every distinct url on the thread pool; failures come back as the exception."""
+    urls = list(dict.fromkeys(urls))
+    futures = [pool.submit(fetch, url) for url in urls]
+    results = {}
+    for url, fut in zip(urls, futures):
+        try:
+            results[url] = fut.result()
+        except Exception as e:
+            results[url] = e
+    return results
+
+_CSS_URL = re.compile(r"""url\(\s*['"]?([^'")]+?)['"]?\s*\)""")
+
+def _prepare_pages(urls, tmp_dir, fetch_workers=8, timeout=15, retries=3, cache=None, session=None):
+    """Download pages, then their stylesheets and images, then images referenced from those stylesheets,
+    each wave concurrently. Every page is written to tmp_dir as self-contained HTML (CSS inlined, images
+    as data URIs) so rendering needs no network. Returns ([(url, html_path)], {url: error})."""
+    session = session or http_session(retries, fetch_workers)
+    cache = cache if isinstance(cache, HttpCache) or not cache else HttpCache(cache)
+    fetch = lambda url: _http_get(session, cache, url, timeout)
+    failed = {}
+    with ThreadPoolExecutor(max_workers=fetch_workers) as pool:
+        pages = []
+        for url, res in _fetch_all(pool, fetch, urls).items():
+            if isinstance(res, Exception):
+                failed[url] = str(res)
+                continue
+            soup = BeautifulSoup(res[0], "html.parser")
+            base = soup.find("base", href=True)
+            pages.append((url, soup, urljoin(res[2], base["href"]) if base else res[2]))
+        refs = []
+        for _, soup, base in pages:
+            refs += [urljoin(base, link["href"]) for link in soup.find_all("link", rel="stylesheet", href=True)]
+            refs += [urljoin(base, img["src"]) for img in soup.find_all("img", src=True) if not img["src"].startswith("data:")]
+        assets = _fetch_all(pool, fetch, refs)
+        css = {url: res[0].decode("utf-8", errors="ignore") for url, res in assets.items()
+               if not isinstance(res, Exception) and "css" in res[1]}
+        for url, text in css.items():
+            refs += [urljoin(url, ref) for ref in _CSS_URL.findall(text) if not ref.startswith("data:")]
+        assets.update(_fetch_all(pool, fetch, [ref for ref in refs if ref not in assets]))
+
+    def image(url):
+        res = assets.get(url)
+        if res is None or isinstance(res, Exception): return None
+        mime = res[1].split(";")[0].strip() or mimetypes.guess_type(url)[0] or ""
+        return _data_uri(res[0], mime) if mime.startswith("image/") else None
+
+    def inline_css(text, base):
+        def repl(m):
+            if m.group(1).startswith("data:"): return m.group(0)
+            uri = image(urljoin(base, m.group(1)))
+            # anything that could not be inlined is dropped, otherwise pisa would fetch it serially
+            return f"url({uri})" if uri else "none"
+        return _CSS_URL.sub(repl, text)
+
+    prepared = []
+    for i, (url, soup, base) in enumerate(pages):
+        styles = []
+        for link in soup.find_all("link", rel="stylesheet", href=True):
+            href = urljoin(base, link["href"])
+            if href in css: styles.append(inline_css(css[href], href))
+            link.decompose()
+        for style in soup.find_all("style"):
+            style.string = inline_css(style.get_text(), base)
+        for img in soup.find_all("img", src=True):
+            if img["src"].startswith("data:"): continue
+            uri = image(urljoin(base, img["src"]))
+            if uri: img["src"] = uri
+            else: img.decompose()
+        for tag in soup.find_all(["script", "noscript", "iframe"]):
+            tag.decompose()
+        head = soup.head or soup
+        tag = soup.new_tag("style")
+        tag.string = "\n".join(styles)
+        head.insert(0, tag)
+        html_path = os.path.join(tmp_dir, f"page_{i}.html")
+        with open(html_path, "w", encoding="utf-8") as f: f.write(str(soup))
+        prepared.append((url, html_path))
+    return prepared, failed
+
+def _render_html(url, html_path, output_path):
+    """Pool worker: returns (url, output_path, error). output_path may be a binary file object."""
+    try:
+        with open(html_path, encoding="utf-8") as f: source = f.read()
+        if _is_path(output_path):
+            with open(output_path, "wb") as f:
+                status = pisa.CreatePDF(source, dest=f)
+        else:
+            status = pisa.CreatePDF(source, dest=output_path)
+        if status.err: raise Exception("PDF generation failed")
+        return url, output_path, None
+    except Exception as e:
+        if _is_path(output_path) and os.path.exists(output_path): os.remove(output_path)
+        return url, None, str(e)
+
+def _url_filename(url):
+    parsed = urlparse(url)
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", parsed.netloc + parsed.path).strip("_")
+    return (slug or "page")[:80]
+
+def urls_to_pdfs(urls, output_dir, workers=None, fetch_workers=8, timeout=15, retries=3,
+                 cache=None, session=None):
+    """Convert a batch of URLs, one PDF each. Pages and subresources are fetched concurrently over one
+    pooled session, then pisa renders in the process pool. cache is a directory (URL_CACHE_DIR, say) or
+    an HttpCache to keep responses between runs; by default nothing is written to disk.
+    Returns (done, failed): {url: pdf_path} and {url: error message}."""
+    urls = [url if url.startswith("http") else "http://" + url for url in urls]
+    os.makedirs(output_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        prepared, failed = _prepare_pages(urls, tmp, fetch_workers, timeout, retries, cache, session)
+        jobs = [(url, html_path, os.path.join(output_dir, f"{i + 1:04d}_{_url_filename(url)}.pdf"))
+                for i, (url, html_path) in enumerate(prepared)]
+        done = {}
+        for url, pdf_path, error in _pool_map(_render_html, jobs, workers, ordered=False):
+            if error: failed[url] = error
+            else: done[url] = pdf_path
+    return done, failed
+
+def url_to_pdf(url, output_path, timeout=15, retries=3, cache=None, session=None):
     try:
         if not url.startswith("http"): url = "http://" + url
-        res = requests.get(url)
-        if res.status_code != 200: raise Exception(f"HTTP Error: {res.status_code}")
-        with open(output_path, "wb") as result_file:
-            pisa_status = pisa.CreatePDF(res.text, dest=result_file)
-        if pisa_status.err: raise Exception("PDF generation failed")
+        with tempfile.TemporaryDirectory() as tmp:
+            prepared, failed = _prepare_pages([url], tmp, 8, timeout, retries, cache, session)
+            if failed: raise Exception(failed[url])
+            _, _, error = _render_html(url, prepared[0][1], output_path)
+        if error: raise Exception(error)
     except Exception as e:
         raise Exception(f"Failed to convert URL: {str(e)}")
 
-def pdf_to_csv(input_path, output_path):
-    with pdfplumber.open(input_path) as pdf:
-        all_rows = []
-        for page in pdf.pages:
-            tables = page.extract_tables()
+def pdf_to_csv(input_path, output_path, pages=None, backend="pdfplumber", workers=None):
+    """Rows are written as each page's tables arrive, in page order. Returns extraction stats."""
+    stats = {}
+    with _text_output(output_path, newline="") as f:
+        writer = csv.writer(f)
+        for _, tables in iter_tables(input_path, pages, backend, workers, stats=stats):
             for table in tables:
-                all_rows.extend(table)
-    if all_rows:
-        df = pd.DataFrame(all_rows)
-        df.to_csv(output_path, index=False, header=False)
-    else:
-        pd.DataFrame().to_csv(output_path)
+                writer.writerows(table)
+    return stats
+
+def _epub_chapters(book_dir):
+    """Return the XHTML chapter files of an unpacked EPUB in spine order."""
+    container = ET.parse(os.path.join(book_dir, "META-INF", "container.xml"))
+    opf_path = os.path.join(book_dir, *container.find(".//{*}rootfile").get("full-path").split("/"))
+    opf = ET.parse(opf_path)
+    manifest = {item.get("id"): item for item in opf.findall(".//{*}manifest/{*}item")}
+    chapters = []
+    for ref in opf.findall(".//{*}spine/{*}itemref"):
+        item = manifest.get(ref.get("idref"))
+        if item is None or item.get("media-type") not in ("application/xhtml+xml", "text/html"): continue
+        path = os.path.join(os.path.dirname(opf_path), *unquote(item.get("href")).split("/"))
+        if os.path.isfile(path): chapters.append(path)
+    return chapters
 
-def epub_to_pdf(input_path, output_path):
+def _book_file(base_dir, href):
+    if href.startswith(("data:", "http:", "https:")): return None
+    path = os.path.normpath(os.path.join(base_dir, unquote(href.split("#")[0].split("?")[0])))
+    return path if os.path.isfile(path) else None
+
+def _render_chapter(chapter_path, output_path):
+    base_dir = os.path.dirname(chapter_path)
+    with open(chapter_path, "rb") as f:
+        soup = BeautifulSoup(f.read().decode('utf-8', errors='ignore'), 'html.parser')
+    heading = soup.find(["h1", "h2", "h3"]) or soup.title
+    title = " ".join(heading.get_text().split()) if heading else ""
+    css = []
+    for link in soup.find_all("link", rel="stylesheet", href=True):
+        css_path = _book_file(base_dir, link["href"])
+        if css_path:
+            with open(css_path, encoding="utf-8", errors="ignore") as f:
+                css.append(f.read())
+    css.extend(style.get_text() for style in soup.find_all("style"))
+    body = soup.body or soup
+    # images are inlined so pisa never has to reach outside the chapter's folder
+    for img in body.find_all("img", src=True):
+        img_path = _book_file(base_dir, img["src"])
+        if img_path:
+            with open(img_path, "rb") as f:
+                img["src"] = _data_uri(f.read(), mimetypes.guess_type(img_path)[0] or "image/jpeg")
+    # pisa's DOM cleanup trips over namespaced attributes such as xml:lang
+    for tag in body.find_all(True):
+        for attr in [a for a in tag.attrs if ":" in a]:
+            del tag[attr]
+    with open(output_path, "wb") as f:
+        pisa.CreatePDF(f"<html><head><style>{''.join(css)}</style></head>{body}</html>", dest=f)
+    return title, output_path
+
+def epub_to_pdf(input_path, output_path, workers=None):
+    """Render each chapter on its own in the process pool, then join them with a chapter outline."""
     try:
-        book = epub.read_epub(input_path)
-        content = "<html><body>"
-        for item in book.get_items():
-            if item.get_type() == ebooklib.ITEM_DOCUMENT:
-                raw = item.get_content().decode('utf-8', errors='ignore')
-                soup = BeautifulSoup(raw, 'html.parser')
-                if soup.body: content += str(soup.body)
-                else: content += str(soup)
-        content += "</body></html>"
-        with open(output_path, "wb") as f:
-            pisa.CreatePDF(content, dest=f)
+        with tempfile.TemporaryDirectory() as tmp:
+            book_dir = os.path.join(tmp, "book")
+            with zipfile.ZipFile(_image_source(input_path)) as zf:
+                zf.extractall(book_dir)
+            jobs = [(path, os.path.join(tmp, f"chapter_{i}.pdf")) for i, path in enumerate(_epub_chapters(book_dir))]
+            doc = fitz.open()
+            toc = []
+            for title, pdf_path in _pool_map(_render_chapter, jobs, workers):
+                try:
+                    part = fitz.open(pdf_path)
+                except Exception:
+                    continue # pisa gave up on this chapter entirely
+                with part:
+                    if not len(part): continue
+                    toc.append([1, title or f"Chapter {len(toc) + 1}", len(doc) + 1])
+                    doc.insert_pdf(part)
+                os.remove(pdf_path)
+            if not len(doc): raise Exception("No chapters could be rendered")
+            doc.set_toc(toc)
+            doc.save(output_path, **_SAVE_OPTIONS)
+            doc.close()
     except Exception as e:
         raise Exception(f"EPUB conversion failed: {str(e)}")
 
-def create_pdf(text_content, output_path):
-    c = canvas.Canvas(output_path, pagesize=letter)
-    width, height = letter
-    y = height - 50
-    c.setFont("Helvetica", 12)
-    lines = text_content.split('\n')
-    for line in lines:
-        if y < 50:
-            c.showPage()
-            y = height - 50
-            c.setFont("Helvetica", 12)
-        c.drawString(50, y, line)
-        y -= 15
-    c.save()
-
-def translate_pdf(input_path, output_path, target_lang='en'):
-    doc = fitz.open(input_path)
-    full_text = ""
-    for page in doc: full_text += page.get_text()
-    chunks = [full_text[i:i+4000] for i in range(0, len(full_text), 4000)]
-    translator = GoogleTranslator(source='auto', target=target_lang)
-    translated_text = ""
-    for chunk in chunks:
-        translated_text += translator.translate(chunk) + "\n"
-    create_pdf(translated_text, output_path)
-
-def add_text_annotation(input_path, output_path, text, x, y):
-    reader = PdfReader(input_path)
-    writer = PdfWriter()
-    packet = BytesIO()
-    can = canvas.Canvas(packet, pagesize=letter)
-    can.setFont("Helvetica", 12)
-    can.drawString(float(x), float(y), text)
-    can.save()
-    packet.seek(0)
-    text_pdf = PdfReader(packet)
-    text_page = text_pdf.pages[0]
-    for page in reader.pages:
-        page.merge_page(text_page)
-        writer.add_page(page)
-    with open(output_path, "wb") as f:
-        writer.write(f)
-
-def pdf_to_tiff(input_path, output_path):
-    doc = fitz.open(input_path)
-    img_list = []
-    for i in range(len(doc)):
-        page = doc.load_page(i)
-        pix = page.get_pixmap()
-        img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-        img_list.append(img)
-    if img_list:
-        img_list[0].save(output_path, save_all=True, append_images=img_list[1:], compression="tiff_deflate")
-
-def sign_pdf(input_path, output_path, signature_image_path, x=100, y=100, width=150, height=50):
+def create_pdf(text_content, output_path, **layout):
+    """text_content may be a string, an open text file or any iterable of lines; layout options
+    go to TextPdfWriter. Returns the page count."""
+    layout = {"fontsize": 12, "leading": 15, "margin": 50, **layout}
+    with TextPdfWriter(output_path, **layout) as writer:
+        writer.write_lines(_text_lines(text_content))
+    return writer.page
+
+def text_file_to_pdf(input_path, output_path, encoding="utf-8", **layout):
+    layout.setdefault("title", os.path.basename(input_path))
+    layout.setdefault("footer", "{title} - {page}")
+    with open(input_path, encoding=encoding, errors="replace") as f:
+        return create_pdf(f, output_path, **layout)
+
+class _KeyValueStore:
+    """A SQLite table keyed by key_column (in memory when path is None), the base of the persistent
+    caches. Subclasses name the table and its other columns; get_many returns the first of them."""
+    table, key_column, columns = "store", "key", ("value TEXT",)
+
+    def __init__(self, path=None):
+        self.conn = sqlite3.connect(path or ":memory:")
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS {self.table} "
+                          f"({self.key_column} TEXT PRIMARY KEY, {', '.join(self.columns)})")
+
+    def get_many(self, keys):
+        found = {}
+        keys = list(keys)
+        value = self.columns[0].split()[0]
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            query = (f"SELECT {self.key_column}, {value} FROM {self.table} "
+                     f"WHERE {self.key_column} IN ({','.join('?' * len(chunk))})")
+            found.update(self.conn.execute(query, chunk))
+        return found
+
+    def put_many(self, items):
+        with self.conn:
+            placeholders = ", ".join("?" * (len(self.columns) + 1))
+            self.conn.executemany(f"INSERT OR REPLACE INTO {self.table} VALUES ({placeholders})", items)
+
+    def close(self):
+        self.conn.close()
+
+TRANSLATION_MEMORY_PATH = os.path.join(os.path.expanduser("~"), ".pdf_studio_translations.db")
+
+class TranslationMemory(_KeyValueStore):
+    """Persistent cache of translated segments in SQLite, keyed by a hash of the source text,
+    target language and translator, so repeated boilerplate is only ever translated once."""
+    table, columns = "memory", ("text TEXT",)
+
+    @staticmethod
+    def key(text, target_lang, backend):
+        return hashlib.sha1(f"{backend}\0{target_lang}\0{text}".encode("utf-8")).hexdigest()
+
+def _split_sentences(text, max_chars):
+    """Split text into pieces of at most max_chars, breaking between sentences where possible."""
+    if len(text) <= max_chars: return [text]
+    pieces, current = [], ""
+    for sentence in re.split(r"(?<=[.!?\u3002\uff01\uff1f])\s+", text):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            if cut <= 0: cut = max_chars
+            if current: pieces.append(current); current = ""
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:].lstrip()
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current: pieces.append(current)
+    return pieces
+
+def _translate_batch(translator, segments):
+    """Translate segments in one request, falling back to one request each if the
+    translator does not keep the paragraph separators intact."""
+    result = translator.translate("\n\n".join(segments)) or ""
+    parts = [p.strip() for p in re.split(r"\n\s*\n", result)]
+    if len(parts) == len(segments): return parts
+    return [(translator.translate(seg) or "").strip() for seg in segments]
+
+def translate_pdf(input_path, output_path, target_lang='en', translator=None, memory_path=TRANSLATION_MEMORY_PATH,
+                  max_chars=4000, concurrency=4):
+    """Translate page by page into a PDF with the same page count and sizes.
+    translator is any object with translate(text) -> str, or a factory returning one such as a class
+    (GoogleTranslator by default); text is sent in sentence-aligned batches of up to max_chars. A factory
+    gives each of the `concurrency` threads its own translator; a translator object is not assumed to be
+    thread-safe and handles one request at a time."""
+    if translator is None:
+        translator = lambda: GoogleTranslator(source='auto', target=target_lang)
+    if hasattr(translator, "translate") and not isinstance(translator, type):
+        factory, concurrency = None, 1
+    else:
+        factory, translator = translator, translator()
+    backend = type(translator).__name__
+    local = threading.local()
+
+    def translate_batch(batch):
+        # deep_translator keeps the query on the instance, so threads must not share one
+        if factory and not hasattr(local, "translator"): local.translator = factory()
+        return _translate_batch(local.translator if factory else translator, batch)
+
+    with _pdf_input(input_path) as src, DOCUMENT_CACHE.fitz(src) as doc:
+        sizes = [(page.rect.width, page.rect.height) for page in doc]
+        pages = []
+        for page in doc:
+            blocks = [" ".join(b[4].split()) for b in page.get_text("blocks") if b[6] == 0]
+            pages.append([_split_sentences(b, max_chars) for b in blocks if b])
+    segments = list(dict.fromkeys(seg for blocks in pages for segs in blocks for seg in segs))
+    memory = TranslationMemory(memory_path)
+    try:
+        keys = {seg: TranslationMemory.key(seg, target_lang, backend) for seg in segments}
+        cached = memory.get_many(keys.values())
+        translated = {seg: cached[keys[seg]] for seg in segments if keys[seg] in cached}
+        batches, current, size = [], [], 0
+        for seg in segments:
+            if seg in translated: continue
+            if current and size + len(seg) + 2 > max_chars:
+                batches.append(current)
+                current, size = [], 0
+            current.append(seg)
+            size += len(seg) + 2
+        if current: batches.append(current)
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            for batch, results in zip(batches, pool.map(translate_batch, batches)):
+                translated.update(zip(batch, results))
+                memory.put_many([(keys[seg], text) for seg, text in zip(batch, results)])
+    finally:
+        memory.close()
+    out = fitz.open()
+    for (w, h), blocks in zip(sizes, pages):
+        page = out.new_page(width=w, height=h)
+        body = "".join(f"<p>{html.escape(' '.join(translated[s] for s in segs))}</p>" for segs in blocks)
+        if body: page.insert_htmlbox(page.rect + (36, 36, -36, -36), body, scale_low=0)
+    out.save(output_path, garbage=3, deflate=True)
+    out.close()
+
+def add_text_annotation(input_path, output_path, text, x, y, incremental=False):
+    stamp_pdf(input_path, output_path, [TextStamp(_literal(text), (float(x), float(y)), fontsize=12)], incremental)
+
+_TIFF_COMPRESSION = {"deflate": "tiff_deflate", "lzw": "tiff_lzw", "group4": "group4", "jpeg": "jpeg", "none": None}
+
+def pdf_to_tiff(input_path, output_path, dpi=72, compression="deflate", grayscale=False, pages=None, workers=None):
+    """Stream pages into a multi-page TIFF one at a time; only the pages in flight are held in memory."""
+    if compression not in _TIFF_COMPRESSION:
+        raise ValueError(f"Unsupported TIFF compression: {compression}")
+    bilevel = compression == "group4"
+    workers = _worker_count(workers, os.cpu_count() or 1)
+    rendered = render_pages(input_path, pages=pages, dpi=dpi, fmt="raw", grayscale=grayscale or bilevel,
+                            workers=workers, batch_size=1, window=workers)
+    written = 0
+    with TiffImagePlugin.AppendingTiffWriter(output_path, new=True) as tf:
+        for _, raw in rendered:
+            img = _samples_to_image(*raw)
+            if bilevel: img = img.convert("1", dither=Image.NONE)
+            img.save(tf, format="TIFF", compression=_TIFF_COMPRESSION[compression], dpi=(dpi, dpi))
+            tf.newFrame()
+            written += 1
+    if not written and _is_path(output_path): os.remove(output_path)
+
+def sign_pdf(input_path, output_path, signature_image_path, x=100, y=100, width=150, height=50, incremental=False):
     """Add a signature image to all pages of a PDF."""
-    doc = fitz.open(input_path)
-    sig_img = fitz.open(signature_image_path)
-    
-    for page in doc:
-        rect = fitz.Rect(x, y, x + width, y + height)
-        page.insert_image(rect, filename=signature_image_path)
-    
-    doc.save(output_path)
-    doc.close()
-
-def flatten_pdf(input_path, output_path):
-    """Flatten PDF - convert interactive elements to static content."""
-    doc = fitz.open(input_path)
-    
-    for page in doc:
-        # Flatten annotations
-        annots = page.annots()
-        if annots:
-            for annot in annots:
-                annot.update()
-        
-        # Flatten form fields by rendering page to image and back
-        pix = page.get_pixmap(dpi=150)
-    
-    # Save with garbage collection to remove unused objects
-    doc.save(output_path, garbage=4, deflate=True)
-    doc.close()
+    stamp_pdf(input_path, output_path, [ImageStamp(signature_image_path, (x, y, width, height))], incremental)
+
+def flatten_pdf(input_path, output_path, mode="vector", dpi=150, quality=85, grayscale=False, annots=True,
+                workers=None):
+    """Turn form fields (and annotations, unless annots=False) into plain page content. mode="vector"
+    bakes their appearance streams into each page's content, keeping text selectable; mode="rasterize"
+    renders pages in the process pool at dpi and rebuilds an image-only PDF. Returns timing stats."""
+    if mode not in ("vector", "rasterize"):
+        raise ValueError(f"Unknown flatten mode: {mode}")
+    start = time.perf_counter()
+    with _pdf_input(input_path) as src:
+        if mode == "vector":
+            with _open_fitz(src) as doc:
+                pages = len(doc)
+                doc.bake(annots=annots, widgets=True)
+                doc.save(output_path, **_SAVE_OPTIONS)
+        else:
+            with DOCUMENT_CACHE.fitz(src) as cached:
+                sizes = [(page.rect.width, page.rect.height) for page in cached]
+            pages = len(sizes)
+            doc = fitz.open()
+            try:
+                # widgets and annotations are part of the rendered pixmap, so nothing interactive survives
+                for index, data in render_pages(src, dpi=dpi, fmt="jpeg", grayscale=grayscale,
+                                                quality=quality, workers=workers):
+                    page = doc.new_page(width=sizes[index][0], height=sizes[index][1])
+                    page.insert_image(page.rect, stream=data)
+                doc.save(output_path, garbage=3, deflate=True)
+            finally:
+                doc.close()
+        bytes_in = _source_size(src)
+    seconds = time.perf_counter() - start
+    return {"mode": mode, "pages": pages, "seconds": seconds,
+            "pages_per_second": pages / seconds if seconds else 0.0,
+            "bytes_in": bytes_in, "bytes_out": _output_size(output_path)}
+
+OCR_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".pdf_studio_ocr.db")
+
+class OcrCache(_KeyValueStore):
+    """Persistent cache of OCR text layers in SQLite, keyed by a hash of the page content, dpi and
+    language, so re-running OCR on a document (or on pages it shares with others) costs nothing."""
+    table, columns = "layers", ("pdf BLOB",)
+
+    @staticmethod
+    def key(doc, page, dpi, lang):
+        h = hashlib.sha1(f"{dpi}\0{lang}\0{tuple(page.rect)}\0{page.rotation}\0".encode())
+        h.update(page.read_contents())
+        for xref in sorted({img[0] for img in page.get_images(full=True)}):
+            h.update(doc.xref_stream_raw(xref) or b"")
+        return h.hexdigest()
+
+def _ocr_page(input_path, key, index, dpi, lang, single_thread):
+    # tesseract spreads one page over every core by default, which only thrashes next to the pool
+    if single_thread: os.environ["OMP_THREAD_LIMIT"] = "1"
+    with _worker_doc(input_path) as doc:
+        pix = doc[index].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+    img = _samples_to_image(pix.width, pix.height, pix.n, pix.samples)
+    return key, pytesseract.image_to_pdf_or_hocr(img, extension="pdf", lang=lang,
+                                                 config=f"--dpi {dpi} -c textonly_pdf=1")
+
+def ocr_pdf(input_path, output_path, lang="eng", dpi=300, pages=None, skip_text=True, workers=None,
+            cache_path=OCR_CACHE_PATH):
+    """Make scanned pages searchable: pages are rendered and run through Tesseract in the process pool,
+    and each result is laid over the original page as invisible text, so the page looks unchanged.
+    Pages that already have text are left alone unless skip_text=False. Returns stats."""
+    if pytesseract is None:
+        raise ImportError("pytesseract library not available")
+    start = time.perf_counter()
+    stats = {"pages": 0, "ocr": 0, "cached": 0, "skipped": 0}
+    with _pdf_input(input_path) as src, _open_fitz(src) as doc:
+        targets = {}
+        for index in parse_page_range(pages, len(doc)):
+            page = doc[index]
+            stats["pages"] += 1
+            if skip_text and page.get_text("text").strip():
+                stats["skipped"] += 1
+                continue
+            # identical pages (blank separators, repeated forms) share one OCR job
+            targets.setdefault(OcrCache.key(doc, page, dpi, lang), []).append(index)
+        cache = OcrCache(cache_path)
+        try:
+            layers = cache.get_many(targets)
+            stats["cached"] = sum(len(targets[key]) for key in layers)
+            jobs = [(src, key, indices[0], dpi, lang) for key, indices in targets.items() if key not in layers]
+            single_thread = _worker_count(workers, len(jobs)) > 1
+            for key, pdf in _pool_map(_ocr_page, [job + (single_thread,) for job in jobs], workers, ordered=False):
+                cache.put_many([(key, pdf)])
+                layers[key] = pdf
+                stats["ocr"] += len(targets[key])
+        finally:
+            cache.close()
+        for key, indices in targets.items():
+            with fitz.open("pdf", layers[key]) as layer:
+                for index in indices:
+                    page = doc[index]
+                    # the layer was read off the page as displayed, so rotated pages take it turned back
+                    page.show_pdf_page(page.rect * page.derotation_matrix, layer, 0, rotate=page.rotation)
+        doc.save(output_path, **_SAVE_OPTIONS)
+    seconds = time.perf_counter() - start
+    stats.update(seconds=seconds, pages_per_second=stats["pages"] / seconds if seconds else 0.0)
+    return stats
+
+FINGERPRINT_PATH = os.path.join(os.path.expanduser("~"), ".pdf_studio_fingerprints.db")
+_CONTENT_NAME = re.compile(rb"/([^\s/\[\]()<>{}%]+)")
+
+class FingerprintStore(_KeyValueStore):
+    """Persistent page fingerprints per file in SQLite. Entries are tied to the file's size and
+    modification time, so a file is only fingerprinted again once it changes."""
+    table, key_column, columns = "files", "path", ("stamp TEXT", "prints TEXT")
+
+    @staticmethod
+    def stamp(path):
+        # the leading version retires prints stored before the fingerprint changed
+        st = os.stat(path)
+        return f"2:{st.st_size}:{st.st_mtime_ns}"
+
+    def get(self, path, stamp):
+        row = self.conn.execute("SELECT prints FROM files WHERE path = ? AND stamp = ?", (path, stamp)).fetchone()
+        return [tuple(p) for p in json.loads(row[0])] if row else None
+
+    def put(self, path, stamp, prints):
+        self.put_many([(path, stamp, json.dumps(prints))])
+
+def _content_fingerprint(doc, page, fonts=None):
+    """Hash of the page's content stream with whitespace collapsed and resource names (which differ
+    from file to file) replaced by what they point to, so a page copied between documents still matches.
+    fonts caches font hashes by xref across pages of the same document."""
+    def stream_hash(xref, *info):
+        # decoded, so the same stream stored plain in one file and deflated in another still matches
+        return hashlib.sha1(repr(info).encode() + (doc.xref_stream(xref) or b"")).hexdigest().encode()
+
+    names = {}
+    for xref, _, width, height, bpc, colorspace, _, name, _, invoker in page.get_images(full=True):
+        if invoker == 0: names[name.encode()] = stream_hash(xref, width, height, bpc, colorspace)
+    for xref, name, invoker, _ in page.get_xobjects():
+        if invoker == 0: names[name.encode()] = stream_hash(xref)
+    fonts = {} if fonts is None else fonts
+    for xref, ext, _, basefont, name, encoding, invoker in page.get_fonts(full=True):
+        if invoker != 0: continue
+        if xref not in fonts:
+            # embedded fonts by their decoded font file: subsets number their glyphs per file, so the same
+            # codes draw different characters in two subsets of one font; subset prefixes (ABCDEF+) are random
+            data = doc.extract_font(xref)[3] if ext != "n/a" else b""
+            fonts[xref] = (hashlib.sha1(data).hexdigest().encode() if data else
+                           f"{re.sub(r'^[A-Z]{6}[+]', '', basefont)}:{encoding}".encode())
+        names[name.encode()] = fonts[xref]
+    content = _CONTENT_NAME.sub(lambda m: b"/" + names.get(m.group(1), m.group(1)), page.read_contents())
+    h = hashlib.sha1(f"{tuple(round(v, 1) for v in page.rect)}:{page.rotation}:".encode())
+    h.update(b" ".join(content.split()))
+    return h.hexdigest()
+
+def _visual_fingerprint(page, size=64):
+    """64-bit difference hash of a tiny grayscale render: survives re-scans and re-encodes of a page."""
+    zoom = size / max(page.rect.width, page.rect.height)
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+    pixels = list(_samples_to_image(pix.width, pix.height, 1, pix.samples).resize((9, 8), Image.LANCZOS).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = bits << 1 | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+def _fingerprint_pages(input_path, indices, perceptual):
+    with _worker_doc(input_path) as doc:
+        fonts = {}
+        prints = [(_content_fingerprint(doc, doc[i], fonts), _visual_fingerprint(doc[i]) if perceptual else None)
+                  for i in indices]
+    return input_path, indices, prints
+
+def page_fingerprints(pdf_paths, perceptual=False, workers=None, store_path=FINGERPRINT_PATH, batch_size=64):
+    """Fingerprint every page of every file in the process pool. Returns {path: [(content, visual), ...]}
+    with visual None unless perceptual=True. Files unchanged since the last run come from the store."""
+    store = FingerprintStore(store_path)
+    try:
+        found, stamps, jobs = {}, {}, []
+        for path in dict.fromkeys(os.fspath(p) for p in pdf_paths):
+            stamps[path] = FingerprintStore.stamp(path)
+            prints = store.get(path, stamps[path])
+            if prints is not None and not (perceptual and any(v is None for _, v in prints)):
+                found[path] = prints
+                continue
+            total = page_count(path)
+            found[path] = [None] * total
+            jobs += [(path, range(i, min(i + batch_size, total)), perceptual) for i in range(0, total, batch_size)]
+        remaining = {}
+        for path, *_ in jobs: remaining[path] = remaining.get(path, 0) + 1
+        for path, indices, prints in _pool_map(_fingerprint_pages, jobs, workers, ordered=False):
+            found[path][indices.start:indices.stop] = prints
+            remaining[path] -= 1
+            if not remaining[path]: store.put(path, stamps[path], found[path])
+    finally:
+        store.close()
+    return found
+
+def find_duplicate_pages(pdf_paths, perceptual=False, workers=None, store_path=FINGERPRINT_PATH):
+    """Groups of identical pages across pdf_paths, as lists of (path, 0-based page) in file and page order,
+    so the first entry of each group is the copy to keep. perceptual=True matches pages that look the
+    same rather than pages with the same content stream, which catches re-scans but also pages that
+    differ only in small print such as page numbers."""
+    groups = {}
+    for path, prints in page_fingerprints(pdf_paths, perceptual, workers, store_path).items():
+        for i, (content, visual) in enumerate(prints):
+            groups.setdefault(visual if perceptual else content, []).append((path, i))
+    return [group for group in groups.values() if len(group) > 1]
+
+def remove_duplicate_pages(pdf_paths, output_dir, perceptual=False, workers=None, store_path=FINGERPRINT_PATH):
+    """Write each file to output_dir without the pages that repeat one seen earlier in the same file or
+    in a file before it, keeping the inputs' folder layout below their common parent so files with the
+    same name don't overwrite each other. Returns (done, failed): {input_path: (output_path, pages removed)}
+    and {input_path: error message}."""
+    paths = list(dict.fromkeys(os.fspath(p) for p in pdf_paths))
+    if not paths: return {}, {}
+    drop = {}
+    for group in find_duplicate_pages(paths, perceptual, workers, store_path):
+        for path, i in group[1:]:
+            drop.setdefault(path, []).append(i + 1)
+    parent = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in paths])
+    done, failed = {}, {}
+    for path in paths:
+        output_path = os.path.join(output_dir, os.path.relpath(os.path.abspath(path), parent))
+        pages = drop.get(path, [])
+        try:
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            if pages and len(pages) == page_count(path):
+                raise ValueError("every page repeats an earlier one")
+            PageOps(path).delete(pages).save(output_path)
+            done[path] = (output_path, len(pages))
+        except Exception as e:
+            failed[path] = str(e)
+    return done, failed
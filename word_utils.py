@@ -1,20 +1,33 @@
 import os
+import tempfile
 from docx2pdf import convert as docx_convert
 from pdf_utils import pdf_to_images
 
-def word_to_pdf(input_path, output_path):
-    input_path = os.path.abspath(input_path)
-    output_path = os.path.abspath(output_path)
-    docx_convert(input_path, output_path)
+def word_to_pdf(input_path, output_path=None):
+    """docx2pdf drives Word and only works on files, so bytes or file objects (in or out) go through a
+    private temp folder. With output_path=None the PDF is returned as bytes."""
+    if isinstance(input_path, (str, os.PathLike)) and isinstance(output_path, (str, os.PathLike)):
+        docx_convert(os.path.abspath(input_path), os.path.abspath(output_path))
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        if not isinstance(input_path, (str, os.PathLike)):
+            data = input_path if isinstance(input_path, (bytes, bytearray, memoryview)) else input_path.read()
+            input_path = os.path.join(tmp, "document.docx")
+            with open(input_path, "wb") as f:
+                f.write(data)
+        pdf_path = os.path.join(tmp, "document.pdf")
+        docx_convert(os.path.abspath(input_path), pdf_path)
+        with open(pdf_path, "rb") as f:
+            pdf = f.read()
+    if output_path is None:
+        return pdf
+    if isinstance(output_path, (str, os.PathLike)):
+        with open(output_path, "wb") as f:
+            f.write(pdf)
+    else:
+        output_path.write(pdf)
 
-def word_to_images(input_path, output_dir):
-    temp_pdf = os.path.join(output_dir, "temp_render.pdf")
-    try:
-        word_to_pdf(input_path, temp_pdf)
-        pdf_to_images(temp_pdf, output_dir)
-    except Exception as e:
-        raise e
-    finally:
-        if os.path.exists(temp_pdf):
-             try: os.remove(temp_pdf)
-             except: pass
+def word_to_images(input_path, output_dir, **render_options):
+    if isinstance(input_path, (str, os.PathLike)):
+        render_options.setdefault("name_prefix", os.path.splitext(os.path.basename(input_path))[0])
+    return pdf_to_images(word_to_pdf(input_path), output_dir, **render_options)